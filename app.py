@@ -1,44 +1,80 @@
 from __future__ import annotations
 
 import os
+import gzip
+import queue
+import atexit
+import logging
+import logging.handlers
+import base64
 import json
 import time
 import uuid
+import hmac
+import hashlib
 import asyncio
 import secrets
+import threading
 import mimetypes
 import traceback
 import random
 import string
 import re
 import urllib.parse
-import subprocess
-import tempfile
+from collections import OrderedDict, defaultdict, deque
+from contextlib import ExitStack, contextmanager
+from functools import lru_cache
 from datetime import datetime, timezone
-from typing import Any, Dict, List, Optional, Tuple, Set
+from typing import Any, DefaultDict, Dict, List, Optional, Tuple, Set
 
 import httpx
+import orjson
 import resend
-from fastapi import FastAPI, Request, HTTPException, Form, BackgroundTasks
+from fastapi import FastAPI, Request, HTTPException, Form, BackgroundTasks, Query
 from fastapi.responses import (
     HTMLResponse,
     RedirectResponse,
     Response,
     StreamingResponse,
-    FileResponse,
     JSONResponse,
+    ORJSONResponse,
 )
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from starlette.middleware.sessions import SessionMiddleware
+from starlette.datastructures import MutableHeaders
+from starlette.requests import HTTPConnection
+from itsdangerous.exc import BadSignature
 from starlette.exceptions import HTTPException as StarletteHTTPException
 from dotenv import load_dotenv
 from supabase import create_client, Client
 
+try:
+    import jwt  # PyJWT — local verification of Supabase access tokens
+except ImportError:
+    jwt = None
+
 
 # Load Environment Variables
 load_dotenv()
 
+# ==========================================================================
+# LOGGING (non-blocking)
+# ==========================================================================
+# Request handlers only enqueue records; a background listener thread does
+# the actual stderr writes, so hot routes never block on stdout flushes.
+_log_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(-1)
+_log_listener = logging.handlers.QueueListener(
+    _log_queue, logging.StreamHandler(), respect_handler_level=True
+)
+_log_listener.start()
+atexit.register(_log_listener.stop)
+
+log = logging.getLogger("gorilla")
+log.setLevel(logging.INFO)
+log.addHandler(logging.handlers.QueueHandler(_log_queue))
+log.propagate = False
+
 from backend.e2b_sandbox import E2BSandboxManager
 from backend.ai.lineage_agent import (
     set_log_callback as lineage_set_log,
@@ -46,6 +82,7 @@ from backend.ai.lineage_agent import (
     _append_history,
     _get_history,
     clear_history,
+    close_http_client as lineage_close_http_client,
 )
 
 # ==========================================================================
@@ -80,7 +117,10 @@ for path in possible_bp_paths:
 # If still not found, default to backend/boilerplate and warn
 if not BOILERPLATE_DIR:
     BOILERPLATE_DIR = os.path.join(ROOT_DIR, "backend", "boilerplate")
-    print(f"⚠️ WARNING: Boilerplate directory not found. Expected at: {BOILERPLATE_DIR}")
+    log.warning(f"⚠️ WARNING: Boilerplate directory not found. Expected at: {BOILERPLATE_DIR}")
+
+# Resolved once: project creation reads this flag instead of re-stat'ing the tree
+BOILERPLATE_EXISTS = os.path.isdir(BOILERPLATE_DIR)
 
 # 3. Dev Mode & Limits
 DEV_MODE = os.getenv("DEV_MODE", "1") == "1"
@@ -104,6 +144,8 @@ if RESEND_API_KEY:
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 # [CRITICAL] We MUST use the SERVICE_ROLE_KEY to bypass RLS policies in the backend
 SUPABASE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
+# Optional: lets us verify access tokens offline instead of calling GoTrue
+SUPABASE_JWT_SECRET = os.getenv("SUPABASE_JWT_SECRET")
 
 if not SUPABASE_URL or not SUPABASE_KEY:
     raise RuntimeError("CRITICAL ERROR: SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY must be set in .env to allow project creation.")
@@ -116,19 +158,31 @@ supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
 # ==========================================================================
 
 # In-Memory OTP Store (for Signup/Login verification)
-PENDING_SIGNUPS = {}
+# email -> {"password", "otp", "ts"}, kept in insertion order so expiry and
+# size eviction only ever look at the oldest entries.
+PENDING_SIGNUPS: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+PENDING_SIGNUP_TTL_SECONDS = 600
+PENDING_SIGNUPS_MAX = 10000
+_PENDING_SIGNUPS_LOCK = asyncio.Lock()
 
 # Runtime Management State
 _BOOTING_PROJECTS: Set[str] = set()
-_LAST_ACCESS: Dict[str, float] = {} 
-SHUTDOWN_TIMEOUT_SECONDS = 600 # 10 Minutes
-
-# GLOBAL STATE
-PENDING_SIGNUPS = {}
-_BOOTING_PROJECTS: Set[str] = set()
-_LAST_ACCESS: Dict[str, float] = {}
-SHUTDOWN_TIMEOUT_SECONDS = 600
-_sandbox_manager = None  # ← ADD THIS LINE
+_sandbox_manager = None
+
+# Project ownership cache: project_id -> (expiry timestamp, owner_id).
+# The editor fires several owner-checked routes back-to-back, so owners are
+# kept briefly instead of re-querying `projects` on every hit.
+_OWNER_CACHE: Dict[str, Tuple[float, str]] = {}
+OWNER_CACHE_TTL_SECONDS = 120
+OWNER_CACHE_MAX_ENTRIES = 20000
+
+# Free-tier project counts: owner_id -> (expiry timestamp, count). Only creates
+# near the limit need the exact figure, so a short-lived count lets users well
+# under it skip the quota RPC. Bumped on create, dropped on delete.
+_PROJECT_COUNT_CACHE: Dict[str, Tuple[float, int]] = {}
+PROJECT_COUNT_CACHE_TTL_SECONDS = 30
+PROJECT_COUNT_CACHE_MAX_ENTRIES = 10000
+FREE_PROJECT_LIMIT = 3
 
 # ==========================================================================
 # APP INITIALIZATION & LIFECYCLE
@@ -139,11 +193,68 @@ app = FastAPI(
     title="Gorilla Backend",
     docs_url="/api/docs",       # <--- MOVES the Swagger UI to /api/docs
     redoc_url="/api/redoc",     # <--- MOVES ReDoc to /api/redoc
-    openapi_url="/api/openapi.json" # <--- MOVES the JSON schema
+    openapi_url="/api/openapi.json", # <--- MOVES the JSON schema
+    default_response_class=ORJSONResponse, # dict returns serialize via orjson
 )
 
+class ChangedOnlySessionMiddleware(SessionMiddleware):
+    """
+    SessionMiddleware re-serializes and re-signs the session cookie on every
+    response. This variant only writes Set-Cookie when the session changed
+    (login/logout) or when the signature is past half its max_age, which keeps
+    the sliding expiry without signing on every authenticated request.
+    """
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+
+        connection = HTTPConnection(scope)
+        raw = b"{}"
+        initial_session_was_empty = True
+        stale = False
+        if self.session_cookie in connection.cookies:
+            data = connection.cookies[self.session_cookie].encode("utf-8")
+            try:
+                data, signed_at = self.signer.unsign(data, max_age=self.max_age, return_timestamp=True)
+                raw = base64.b64decode(data)
+                initial_session_was_empty = False
+                if self.max_age:
+                    age = time.time() - signed_at.timestamp()
+                    stale = age > self.max_age / 2
+            except BadSignature:
+                raw = b"{}"
+        # Two independent parses: handlers mutate nested values (session["user"])
+        # in place, so the baseline must not share objects with the live session.
+        initial = json.loads(raw)
+        scope["session"] = json.loads(raw)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                session = scope["session"]
+                if session and (stale or session != initial):
+                    data = base64.b64encode(json.dumps(session).encode("utf-8"))
+                    data = self.signer.sign(data)
+                    headers = MutableHeaders(scope=message)
+                    max_age = f"Max-Age={self.max_age}; " if self.max_age else ""
+                    headers.append(
+                        "Set-Cookie",
+                        f"{self.session_cookie}={data.decode('utf-8')}; path={self.path}; {max_age}{self.security_flags}",
+                    )
+                elif not session and not initial_session_was_empty:
+                    headers = MutableHeaders(scope=message)
+                    headers.append(
+                        "Set-Cookie",
+                        f"{self.session_cookie}=null; path={self.path}; "
+                        f"expires=Thu, 01 Jan 1970 00:00:00 GMT; {self.security_flags}",
+                    )
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
 app.add_middleware(
-    SessionMiddleware,
+    ChangedOnlySessionMiddleware,
     secret_key=os.getenv("AUTH_SECRET_KEY", secrets.token_hex(32)),
 )
 
@@ -155,17 +266,103 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-@app.middleware("http")
-async def add_permissive_headers(request: Request, call_next):
-    response = await call_next(request)
-    response.headers["Content-Security-Policy"] = "frame-src *; frame-ancestors *; child-src *;"
-    response.headers["Cross-Origin-Embedder-Policy"] = "unsafe-none"
-    response.headers["Cross-Origin-Opener-Policy"] = "unsafe-none"
-    response.headers["Cross-Origin-Resource-Policy"] = "cross-origin"
-    return response
+# Constant headers, pre-encoded once. Plain ASGI middleware: no BaseHTTPMiddleware
+# response wrapping, just a header-list rewrite on http.response.start.
+PERMISSIVE_HEADERS: List[Tuple[bytes, bytes]] = [
+    (b"content-security-policy", b"frame-src *; frame-ancestors *; child-src *;"),
+    (b"cross-origin-embedder-policy", b"unsafe-none"),
+    (b"cross-origin-opener-policy", b"unsafe-none"),
+    (b"cross-origin-resource-policy", b"cross-origin"),
+]
+_PERMISSIVE_HEADER_NAMES = frozenset(name for name, _ in PERMISSIVE_HEADERS)
+
+class PermissiveHeadersMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                # Same override semantics as headers[...] = ...: drop any existing values first
+                headers = [h for h in message.get("headers", []) if h[0].lower() not in _PERMISSIVE_HEADER_NAMES]
+                headers.extend(PERMISSIVE_HEADERS)
+                message["headers"] = headers
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+app.add_middleware(PermissiveHeadersMiddleware)
+
+# Shared outbound client for OAuth / provider APIs. One keep-alive pool (HTTP/2
+# where the server offers it) instead of a fresh TLS handshake per callback.
+HTTPX_CLIENT: Optional[httpx.AsyncClient] = None
+
+def _http() -> httpx.AsyncClient:
+    global HTTPX_CLIENT
+    if HTTPX_CLIENT is None or HTTPX_CLIENT.is_closed:
+        HTTPX_CLIENT = httpx.AsyncClient(
+            http2=True,
+            timeout=30.0,
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=50),
+        )
+    return HTTPX_CLIENT
+
+# GitHub publish/push fire a burst of sequential API calls (repo, tree, commit,
+# ref) at one host; a dedicated pool keeps those on warm HTTP/2 connections.
+# Auth is per user, so headers are passed per request, never set on the client.
+GITHUB_HTTPX_CLIENT: Optional[httpx.AsyncClient] = None
+
+def _github_http() -> httpx.AsyncClient:
+    global GITHUB_HTTPX_CLIENT
+    if GITHUB_HTTPX_CLIENT is None or GITHUB_HTTPX_CLIENT.is_closed:
+        GITHUB_HTTPX_CLIENT = httpx.AsyncClient(
+            http2=True,
+            base_url="https://api.github.com",
+            timeout=30.0,
+            limits=httpx.Limits(max_connections=64, max_keepalive_connections=32),
+        )
+    return GITHUB_HTTPX_CLIENT
+
+@app.on_event("startup")
+async def _open_http_client():
+    _http()
+    _github_http()
+
+@app.on_event("shutdown")
+async def _close_http_clients():
+    global HTTPX_CLIENT, GITHUB_HTTPX_CLIENT, POSTGREST_CLIENT
+    if HTTPX_CLIENT is not None:
+        await HTTPX_CLIENT.aclose()
+        HTTPX_CLIENT = None
+    if GITHUB_HTTPX_CLIENT is not None:
+        await GITHUB_HTTPX_CLIENT.aclose()
+        GITHUB_HTTPX_CLIENT = None
+    if POSTGREST_CLIENT is not None:
+        POSTGREST_CLIENT.close()
+        POSTGREST_CLIENT = None
+    await lineage_close_http_client()
+
+# Fingerprinted names (app.3f9a1c2b.js) never change content -> cache for a year.
+# Everything else gets a short public TTL; ETag/Last-Modified still give 304s after.
+_FINGERPRINTED_ASSET_RE = re.compile(r"\.[0-9a-f]{8,}\.")
+STATIC_IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+STATIC_DEFAULT_CACHE_CONTROL = "public, max-age=300"
+
+class CachedStaticFiles(StaticFiles):
+    def file_response(self, full_path, stat_result, scope, status_code=200):
+        response = super().file_response(full_path, stat_result, scope, status_code)
+        if _FINGERPRINTED_ASSET_RE.search(os.path.basename(full_path)):
+            response.headers["Cache-Control"] = STATIC_IMMUTABLE_CACHE_CONTROL
+        else:
+            response.headers["Cache-Control"] = STATIC_DEFAULT_CACHE_CONTROL
+        return response
 
 if os.path.isdir(FRONTEND_STYLES_DIR):
-    app.mount("/styles", StaticFiles(directory=FRONTEND_STYLES_DIR), name="styles")
+    app.mount("/styles", CachedStaticFiles(directory=FRONTEND_STYLES_DIR), name="styles")
 
 templates = Jinja2Templates(directory=FRONTEND_TEMPLATES_DIR)
 
@@ -200,9 +397,49 @@ def db_select_one(table: str, match: dict, select="*"):
         return res.data if res else None
     except Exception: return None
 
+async def db_select_one_async(table: str, match: dict, select="*"):
+    """db_select_one on a worker thread, so the PostgREST round trip never blocks the loop."""
+    return await asyncio.to_thread(db_select_one, table, match, select)
+
 # ==========================================================================
 # DB HELPERS (Integrity Guard)
 # ==========================================================================
+# Preview asset bodies: (project_id, path) -> (expiry, body, media_type, etag).
+# Every files-table write helper below drops the entries it touches, so the
+# TTL only bounds staleness from writers outside this process.
+_FILE_CACHE: Dict[Tuple[str, str], Tuple[float, bytes, str, str]] = {}
+FILE_CACHE_TTL_SECONDS = 300
+FILE_CACHE_MAX_ENTRIES = 2048
+FILE_CACHE_MAX_BODY_BYTES = 1024 * 1024
+# Bumped on every invalidation; a read that overlapped a write won't be cached
+# (writers invalidate again once their write has landed, see _writing_files)
+_FILE_CACHE_EPOCH = 0
+
+def _forget_cached_files(project_id: str, paths: Optional[List[str]] = None) -> None:
+    """Drops cached bodies for `paths`, or for the whole project if None."""
+    global _FILE_CACHE_EPOCH
+    _FILE_CACHE_EPOCH += 1
+    if paths is None:
+        keys = [k for k in list(_FILE_CACHE) if k[0] == project_id]
+    else:
+        keys = [(project_id, p) for p in paths]
+    for key in keys:
+        _FILE_CACHE.pop(key, None)
+
+@contextmanager
+def _writing_files(project_id: str, paths: Optional[List[str]] = None):
+    """Wraps a files-table write. Invalidating again after the write (even a
+    failed one) drops anything a concurrent read cached from the old row."""
+    _forget_cached_files(project_id, paths)
+    try:
+        yield
+    finally:
+        _forget_cached_files(project_id, paths)
+
+# Paths db_upsert refuses to store (see its guards below)
+DB_SKIP_LOCKFILES = ("package-lock.json", "yarn.lock", "pnpm-lock.yaml")
+DB_SKIP_BINARY_EXTS = (".png", ".jpg", ".jpeg", ".gif", ".ico", ".pdf", ".zip")
+
 def db_upsert(table: str, data: Dict[str, Any], on_conflict: str = "id"):
     """
     Enhanced upsert that blocks binary/giant files from entering the DB.
@@ -212,27 +449,51 @@ def db_upsert(table: str, data: Dict[str, Any], on_conflict: str = "id"):
 
     # 1. 🛑 THE LOCKFILE BLOCKER
     # Blocks the Agent or Boilerplate from saving giant lockfiles
-    if path and any(x in path for x in ["package-lock.json", "yarn.lock", "pnpm-lock.yaml"]):
-        print(f"⏩ Skipping {path} (Handled by WebContainer runtime)")
+    if path and any(x in path for x in DB_SKIP_LOCKFILES):
+        log.info(f"⏩ Skipping {path} (Handled by WebContainer runtime)")
         return None
 
     # 2. 🛑 BINARY FILTER
     # Prevents binary data from being stored in the text column
-    if path and path.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.ico', '.pdf', '.zip')):
-        print(f"⏩ Skipping binary file: {path}")
+    if path and path.lower().endswith(DB_SKIP_BINARY_EXTS):
+        log.info(f"⏩ Skipping binary file: {path}")
         return None
 
     # 3. 🛑 INTEGRITY CHECK
     # Ensure we aren't saving empty strings as files
     if table == "files" and not content:
-        print(f"⚠️ Warning: Attempting to save empty file content for {path}")
+        log.warning(f"⚠️ Warning: Attempting to save empty file content for {path}")
 
     try:
-        return supabase.table(table).upsert(data, on_conflict=on_conflict).execute()
+        if table != "files":
+            return supabase.table(table).upsert(data, on_conflict=on_conflict).execute()
+        with _writing_files(str(data.get("project_id")), [path]):
+            return supabase.table(table).upsert(data, on_conflict=on_conflict).execute()
     except Exception as e:
-        print(f"❌ DB Upsert Error for {path}: {e}")
+        log.error(f"❌ DB Upsert Error for {path}: {e}")
         return None
 
+def db_save_file(project_id: str, path: str, content: str) -> None:
+    """
+    Upserts one file and bumps projects.updated_at in a single round trip via
+    the save_project_file RPC (supabase/migrations/0005). Paths db_upsert
+    would refuse, or a missing RPC, take the original two-request route.
+    """
+    if content and not any(x in path for x in DB_SKIP_LOCKFILES) and not path.lower().endswith(DB_SKIP_BINARY_EXTS):
+        try:
+            with _writing_files(project_id, [path]):
+                supabase.rpc("save_project_file", {
+                    "p_project_id": project_id,
+                    "p_path": path,
+                    "p_content": content,
+                }).execute()
+            return
+        except Exception as e:
+            log.warning(f"⚠️ save_project_file RPC failed, using upsert: {e}")
+
+    db_upsert("files", {"project_id": project_id, "path": path, "content": content}, on_conflict="project_id,path")
+    supabase.table("projects").update({"updated_at": "now()"}).eq("id", project_id).execute()
+
 def db_delete(table: str, filters: dict) -> None:
     """Delete rows matching filters. Used by the sandbox manager to remove
     files that the agent deleted in the sandbox (rm commands)."""
@@ -240,26 +501,80 @@ def db_delete(table: str, filters: dict) -> None:
         q = supabase.table(table).delete()
         for k, v in filters.items():
             q = q.eq(k, v)
-        q.execute()
+        if table != "files":
+            q.execute()
+        else:
+            with _writing_files(str(filters.get("project_id")), [filters["path"]] if "path" in filters else None):
+                q.execute()
     except Exception as e:
-        print(f"⚠️ db_delete({table}) failed: {e}")
+        log.warning(f"⚠️ db_delete({table}) failed: {e}")
  
  
+UPSERT_BATCH_CHUNK = 100
+
 def db_upsert_batch(table: str, rows: list, on_conflict: str = "") -> None:
-    """Batch upsert — one HTTP request for many rows (loophole 21)."""
-    if not rows:
-        return
-    try:
-        q = supabase.table(table).upsert(rows, on_conflict=on_conflict)
-        q.execute()
-    except Exception as e:
-        # Fallback to per-row if the batch fails (e.g. one bad row)
-        print(f"⚠️ batch upsert failed, falling back to per-row: {e}")
+    """Batch upsert — one HTTP request per chunk of rows (loophole 21).
+    Each chunk is a single INSERT ... ON CONFLICT statement on the server."""
+    if table == "files":
+        touched: DefaultDict[str, List[str]] = defaultdict(list)
         for row in rows:
-            try:
-                supabase.table(table).upsert(row, on_conflict=on_conflict).execute()
-            except Exception as e2:
-                print(f"⚠️ per-row upsert failed for {row.get('path')}: {e2}")
+            touched[str(row.get("project_id"))].append(row.get("path"))
+        with ExitStack() as stack:
+            for project_id, paths in touched.items():
+                stack.enter_context(_writing_files(project_id, paths))
+            _upsert_chunks(table, rows, on_conflict)
+    else:
+        _upsert_chunks(table, rows, on_conflict)
+
+def _upsert_chunks(table: str, rows: list, on_conflict: str) -> None:
+    for i in range(0, len(rows), UPSERT_BATCH_CHUNK):
+        chunk = rows[i:i + UPSERT_BATCH_CHUNK]
+        try:
+            supabase.table(table).upsert(chunk, on_conflict=on_conflict).execute()
+        except Exception as e:
+            # Fallback to per-row for THIS chunk only (e.g. one bad row)
+            log.warning(f"⚠️ batch upsert failed, falling back to per-row for {len(chunk)} rows: {e}")
+            for row in chunk:
+                try:
+                    supabase.table(table).upsert(row, on_conflict=on_conflict).execute()
+                except Exception as e2:
+                    log.warning(f"⚠️ per-row upsert failed for {row.get('path')}: {e2}")
+ 
+
+# Direct PostgREST client for bodies we encode ourselves (the supabase client
+# always re-serializes its rows). Sync, because callers already run in threads.
+POSTGREST_CLIENT: Optional[httpx.Client] = None
+
+def _postgrest() -> httpx.Client:
+    global POSTGREST_CLIENT
+    if POSTGREST_CLIENT is None or POSTGREST_CLIENT.is_closed:
+        POSTGREST_CLIENT = httpx.Client(
+            base_url=f"{SUPABASE_URL}/rest/v1",
+            headers={
+                "apikey": SUPABASE_KEY,
+                "Authorization": f"Bearer {SUPABASE_KEY}",
+                "Content-Type": "application/json",
+                "Prefer": "return=minimal",
+            },
+            timeout=30.0,
+        )
+    return POSTGREST_CLIENT
+
+def db_insert_raw(table: str, body: bytes) -> None:
+    """Inserts an already JSON-encoded array of rows. Raises on failure."""
+    _postgrest().post(f"/{table}", content=body).raise_for_status()
+ 
+ 
+def db_delete_file_paths(project_id: str, paths: list) -> None:
+    """Delete many file rows with one request per chunk of paths. Raises on
+    failure so the sandbox manager can fall back to per-path deletes."""
+    paths = list(paths)
+    with _writing_files(project_id, paths):
+        # Chunked because PostgREST puts the in.(...) list in the URL
+        for i in range(0, len(paths), 100):
+            supabase.table("files").delete().eq("project_id", project_id).in_(
+                "path", paths[i:i + 100]
+            ).execute()
  
  
 def db_list_file_paths(project_id: str) -> set:
@@ -269,7 +584,7 @@ def db_list_file_paths(project_id: str) -> set:
         res = supabase.table("files").select("path").eq("project_id", project_id).execute()
         return {row["path"] for row in (res.data or []) if row.get("path")}
     except Exception as e:
-        print(f"⚠️ db_list_file_paths failed: {e}")
+        log.warning(f"⚠️ db_list_file_paths failed: {e}")
         return set()
  
  
@@ -280,7 +595,17 @@ def emit_file_deleted(project_id: str, path: str) -> None:
 # ==========================================================================
 # TOKEN MANAGEMENT LOGIC
 # ==========================================================================
-def get_token_usage_and_limit(user_id: str) -> Tuple[int, int]:
+# In-process token counters: user_id -> {used, limit, pending, refreshed_at,
+# flushed_at}. Limit checks within TOKEN_CACHE_REFRESH_S are served from
+# memory, and usage is accumulated locally and written back once it passes
+# TOKEN_FLUSH_DELTA tokens or TOKEN_FLUSH_INTERVAL_S (and at shutdown).
+TOKEN_CACHE_REFRESH_S = 5
+TOKEN_FLUSH_DELTA = 1000
+TOKEN_FLUSH_INTERVAL_S = 10
+_TOKEN_COUNTERS: Dict[str, Dict[str, Any]] = {}
+_TOKEN_COUNTERS_LOCK = threading.Lock()
+
+def _fetch_token_usage(user_id: str) -> Tuple[int, int]:
     """Fetches used tokens and total limit from DB."""
     user = db_select_one("users", {"id": user_id}, "tokens_used, tokens_limit")
     if not user:
@@ -290,30 +615,106 @@ def get_token_usage_and_limit(user_id: str) -> Tuple[int, int]:
     limit = int(user.get("tokens_limit") or DEFAULT_TOKEN_LIMIT)
     return used, limit
 
+def get_token_usage_and_limit(user_id: str) -> Tuple[int, int]:
+    """Used tokens (including not-yet-flushed usage) and total limit."""
+    now = time.time()
+    with _TOKEN_COUNTERS_LOCK:
+        c = _TOKEN_COUNTERS.get(user_id)
+        if c and now - c["refreshed_at"] < TOKEN_CACHE_REFRESH_S:
+            return c["used"] + c["pending"], c["limit"]
+
+    used, limit = _fetch_token_usage(user_id)
+    with _TOKEN_COUNTERS_LOCK:
+        c = _TOKEN_COUNTERS.setdefault(user_id, {"pending": 0, "flushed_at": now})
+        c.update(used=used, limit=limit, refreshed_at=now)
+        return used + c["pending"], limit
+
+def _increment_tokens_used(user_id: str, delta: int) -> int:
+    """
+    Atomically adds `delta` to users.tokens_used and returns the new total
+    (creating the row if needed). Uses the increment_tokens_used RPC from
+    supabase/migrations/0002; falls back to read-then-upsert if the function
+    hasn't been deployed yet.
+    """
+    try:
+        res = supabase.rpc("increment_tokens_used", {
+            "p_user_id": user_id,
+            "p_amount": int(delta),
+            "p_default_limit": DEFAULT_TOKEN_LIMIT,
+        }).execute()
+        if res.data is not None:
+            return int(res.data)
+    except Exception as e:
+        log.warning(f"⚠️ increment_tokens_used RPC failed, using upsert: {e}")
+
+    current_used, _ = _fetch_token_usage(user_id)
+    res = db_upsert(
+        "users",
+        {
+            "id": user_id, 
+            "tokens_used": current_used + delta,
+            # Preserve limit if exists, else default
+            "updated_at": "now()"
+        }, 
+        on_conflict="id"
+    )
+    if res is None:
+        raise RuntimeError("upsert failed")
+    return current_used + delta
+
+def _flush_token_usage(user_id: str) -> None:
+    """Writes a user's accumulated token usage back to the users table."""
+    with _TOKEN_COUNTERS_LOCK:
+        c = _TOKEN_COUNTERS.get(user_id)
+        if not c or c["pending"] <= 0:
+            return
+        delta, c["pending"], c["flushed_at"] = c["pending"], 0, time.time()
+
+    try:
+        new_total = _increment_tokens_used(user_id, delta)
+        with _TOKEN_COUNTERS_LOCK:
+            c["used"], c["refreshed_at"] = new_total, time.time()
+    except Exception as e:
+        # Keep the delta so the next flush retries it
+        with _TOKEN_COUNTERS_LOCK:
+            c["pending"] += delta
+        log.error(f"Token Update Error: {e}")
+
+def flush_all_token_usage() -> None:
+    """Persists every pending counter (called at shutdown)."""
+    for user_id in list(_TOKEN_COUNTERS):
+        _flush_token_usage(user_id)
+
+atexit.register(flush_all_token_usage)
+
+def _forget_token_usage(user_id: str) -> None:
+    """Flushes and drops a user's counter so the next read hits the DB."""
+    _flush_token_usage(user_id)
+    with _TOKEN_COUNTERS_LOCK:
+        _TOKEN_COUNTERS.pop(user_id, None)
+
 def add_monthly_tokens(user_id: str, tokens_to_add: int) -> int:
     """Adds tokens used. If user missing, creates them automatically."""
+    used, limit = get_token_usage_and_limit(user_id)
     if tokens_to_add <= 0:
-        used, _ = get_token_usage_and_limit(user_id)
         return used
     
-    try:
-        current_used, current_limit = get_token_usage_and_limit(user_id)
-        new_total = current_used + int(tokens_to_add)
-        
-        db_upsert(
-            "users",
-            {
-                "id": user_id, 
-                "tokens_used": new_total,
-                # Preserve limit if exists, else default
-                "updated_at": "now()"
-            }, 
-            on_conflict="id"
+    now = time.time()
+    with _TOKEN_COUNTERS_LOCK:
+        c = _TOKEN_COUNTERS.setdefault(user_id, {
+            "used": used, "limit": limit, "pending": 0,
+            "refreshed_at": now, "flushed_at": now,
+        })
+        c["pending"] += int(tokens_to_add)
+        new_total = c["used"] + c["pending"]
+        due = (
+            c["pending"] >= TOKEN_FLUSH_DELTA
+            or now - c["flushed_at"] >= TOKEN_FLUSH_INTERVAL_S
         )
-        return new_total
-    except Exception as e:
-        print(f"Token Update Error: {e}")
-        return 0
+
+    if due:
+        _flush_token_usage(user_id)
+    return new_total
 
 def enforce_token_limit_or_raise(user_id: str) -> Tuple[int, int]:
     """Checks usage against the user's specific limit."""
@@ -329,8 +730,9 @@ def enforce_token_limit_or_raise(user_id: str) -> Tuple[int, int]:
 
 def set_user_plan_and_limit(user_id: str, plan: str, limit: int):
     """Updates user plan and token limit (for upgrades)."""
+    _flush_token_usage(user_id)
     # Force direct update
-    db_upsert(
+    res = db_upsert(
         "users",
         {
             "id": user_id,
@@ -340,47 +742,84 @@ def set_user_plan_and_limit(user_id: str, plan: str, limit: int):
         },
         on_conflict="id"
     )
+    # Write-through: the next limit check sees the new limit without a re-read
+    with _TOKEN_COUNTERS_LOCK:
+        if res is None:
+            _TOKEN_COUNTERS.pop(user_id, None)
+        elif user_id in _TOKEN_COUNTERS:
+            _TOKEN_COUNTERS[user_id]["limit"] = int(limit)
 
 def decrease_tokens_used(user_id: str, amount: int):
     """'Top up' by reducing the 'used' counter (simulates adding balance)."""
-    used, _ = get_token_usage_and_limit(user_id)
+    _forget_token_usage(user_id)
+    used, limit = get_token_usage_and_limit(user_id)
     new_used = max(0, used - amount)
     
-    db_upsert(
+    res = db_upsert(
         "users",
         {"id": user_id, "tokens_used": new_used, "updated_at": "now()"},
         on_conflict="id"
     )
+    # Write-through: seed the counter with what was just stored
+    now = time.time()
+    with _TOKEN_COUNTERS_LOCK:
+        if res is None:
+            _TOKEN_COUNTERS.pop(user_id, None)
+        else:
+            _TOKEN_COUNTERS[user_id] = {
+                "used": new_used, "limit": limit, "pending": 0,
+                "refreshed_at": now, "flushed_at": now,
+            }
 
 # ==========================================================================
 # AUTHENTICATION & USER HELPERS
 # ==========================================================================
 _DEV_NAMESPACE = uuid.UUID("2b48c7cc-51c8-4b50-a5c6-2c4ac3f26cb1")
 
+@lru_cache(maxsize=1024)
+def _uuid5_for_email(normalized_email: str) -> str:
+    return str(uuid.uuid5(_DEV_NAMESPACE, normalized_email))
+
 def _stable_user_id_for_email(email: str) -> str:
     """Generates a consistent UUIDv5 based on email for Dev Mode."""
     e = (email or "").strip().lower()
     if not e: 
         return str(uuid.uuid4())
-    return str(uuid.uuid5(_DEV_NAMESPACE, e))
+    return _uuid5_for_email(e)
+
+# User ids whose public.users row is known to exist (per process). Lets
+# get_current_user skip the insert-or-ignore on every authenticated request.
+# Insertion-ordered dict used as a bounded set: the oldest id goes when full.
+_USER_ENSURED: Dict[str, None] = {}
+USER_ENSURED_MAX_ENTRIES = 100000
 
 def ensure_public_user(user_id: str, email: str) -> None:
     """Ensures the user exists in the public.users table WITHOUT overwriting existing data."""
+    if user_id in _USER_ENSURED:
+        return
     try:
-        # --- FIX: Check existence first! ---
-        existing = db_select_one("users", {"id": user_id}, "id")
-        if existing:
-            return # User exists, do NOT touch their plan/limits
-            
-        # Default new users to free plan and default limit
-        db_upsert(
-            "users", 
-            {"id": user_id, "email": email, "plan": "free", "tokens_limit": DEFAULT_TOKEN_LIMIT}, 
-            on_conflict="id"
-        )
+        # Default new users to free plan and default limit. ignore_duplicates
+        # makes this INSERT ... ON CONFLICT (id) DO NOTHING: one round trip,
+        # and an existing user's plan/limits are never touched.
+        supabase.table("users").upsert(
+            {"id": user_id, "email": email, "plan": "free", "tokens_limit": DEFAULT_TOKEN_LIMIT},
+            on_conflict="id",
+            ignore_duplicates=True,
+        ).execute()
+        if len(_USER_ENSURED) >= USER_ENSURED_MAX_ENTRIES:
+            _USER_ENSURED.pop(next(iter(_USER_ENSURED)), None)
+        _USER_ENSURED[user_id] = None
     except Exception:
         pass
 
+def _auth_user_providers(email: str) -> Optional[List[str]]:
+    """Indexed lookup of one auth account: None if absent, else its identity providers."""
+    res = supabase.rpc("auth_user_providers", {"p_email": email}).execute()
+    # Scalar text[] result: PostgREST sends the array itself (null when no user)
+    if res.data is None:
+        return None
+    return list(res.data)
+
 def get_current_user(request: Request) -> Dict[str, Any]:
     user = request.session.get("user")
  
@@ -397,18 +836,59 @@ def get_current_user(request: Request) -> Dict[str, Any]:
     ensure_public_user(user["id"], user.get("email") or "unknown@local")
     return user
 
+def _project_owner_id(project_id: str) -> Optional[str]:
+    """Owner of a project (None if it doesn't exist), cached for a short TTL."""
+    cached = _OWNER_CACHE.get(project_id)
+    if cached and cached[0] > time.time():
+        return cached[1]
+
+    res = db_select_one("projects", {"id": project_id}, "id, owner_id")
+    if not res or not res.get("owner_id"):
+        return None
+
+    _remember_project_owner(project_id, res["owner_id"])
+    return res["owner_id"]
+
+def _remember_project_owner(project_id: str, owner_id: str) -> None:
+    # Evict the oldest entry when full
+    if len(_OWNER_CACHE) >= OWNER_CACHE_MAX_ENTRIES:
+        _OWNER_CACHE.pop(next(iter(_OWNER_CACHE)), None)
+    _OWNER_CACHE[project_id] = (time.time() + OWNER_CACHE_TTL_SECONDS, owner_id)
+
 def _require_project_owner(user: Dict[str, Any], project_id: str) -> None:
     """Verifies that the current user owns the project."""
-    res = db_select_one("projects", {"id": project_id}, "id, owner_id")
+    owner_id = _project_owner_id(project_id)
     
-    if not res:
+    if not owner_id:
         raise HTTPException(status_code=404, detail="Project not found")
         
-    if res.get("owner_id") != user["id"]:
+    if owner_id != user["id"]:
         # We use 403 to signal "You aren't allowed here" 
         # JavaScript will catch this and trigger the redirect.
         raise HTTPException(status_code=403, detail="Unauthorized Access")
 
+def _forget_project_owner(project_id: str) -> None:
+    """Drops cached ownership for a project (call on delete/transfer)."""
+    _OWNER_CACHE.pop(project_id, None)
+
+def _cached_project_count(owner_id: str) -> Optional[int]:
+    """Recently seen project count for a user, or None if unknown/expired."""
+    cached = _PROJECT_COUNT_CACHE.get(owner_id)
+    if cached and cached[0] > time.time():
+        return cached[1]
+    return None
+
+def _remember_project_count(owner_id: str, count: int) -> None:
+    if len(_PROJECT_COUNT_CACHE) >= PROJECT_COUNT_CACHE_MAX_ENTRIES:
+        _PROJECT_COUNT_CACHE.pop(next(iter(_PROJECT_COUNT_CACHE)), None)
+    _PROJECT_COUNT_CACHE[owner_id] = (time.time() + PROJECT_COUNT_CACHE_TTL_SECONDS, count)
+
+def _bump_project_count(owner_id: str) -> None:
+    """Counts a freshly created project against a cached entry, if any."""
+    cached = _PROJECT_COUNT_CACHE.get(owner_id)
+    if cached:
+        _PROJECT_COUNT_CACHE[owner_id] = (cached[0], cached[1] + 1)
+
 # --- RESEND EMAIL LOGIC ---
 
 import resend # Ensure you have this imported
@@ -418,7 +898,7 @@ import resend # Ensure you have this imported
 
 def send_otp_email(to_email: str, code: str):
     if not RESEND_API_KEY:
-        print(f"⚠️ Resend Key missing. Code for {to_email}: {code}")
+        log.warning(f"⚠️ Resend Key missing. Code for {to_email}: {code}")
         return
     
     try:
@@ -458,10 +938,33 @@ def send_otp_email(to_email: str, code: str):
 
         # 2. Actually trigger the email send via the Resend API
         email = resend.Emails.send(params)
-        print(f"✅ OTP email sent to {to_email}")
+        log.info(f"✅ OTP email sent to {to_email}")
 
     except Exception as e:
-        print(f"❌ Resend Error: {e}")
+        log.error(f"❌ Resend Error: {e}")
+
+# OTP sends are handed to one long-lived worker thread instead of a per-request
+# BackgroundTask, so the signup response never waits on the Resend round trip.
+OTP_QUEUE_MAX = 1000
+_OTP_QUEUE: "queue.Queue[Tuple[str, str]]" = queue.Queue(maxsize=OTP_QUEUE_MAX)
+
+def _otp_email_worker() -> None:
+    while True:
+        to_email, code = _OTP_QUEUE.get()
+        try:
+            send_otp_email(to_email, code)
+        finally:
+            _OTP_QUEUE.task_done()
+
+threading.Thread(target=_otp_email_worker, name="otp-email", daemon=True).start()
+
+def enqueue_otp_email(to_email: str, code: str) -> bool:
+    try:
+        _OTP_QUEUE.put_nowait((to_email, code))
+        return True
+    except queue.Full:
+        log.warning(f"⚠️ OTP queue full, dropping email to {to_email}")
+        return False
 
 # ==========================================================================
 # FIGMA OAUTH INTEGRATION
@@ -510,7 +1013,7 @@ async def figma_callback(request: Request, code: str, state: str):
             })
             
             if res.status_code != 200:
-                print(f"⚠️ Figma OAuth Error: {res.text}")
+                log.error(f"⚠️ Figma OAuth Error: {res.text}")
                 return RedirectResponse("/dashboard?error=figma_token_exchange_failed", status_code=303)
                 
             tokens = res.json()
@@ -527,7 +1030,7 @@ async def figma_callback(request: Request, code: str, state: str):
         return RedirectResponse("/dashboard?success=figma_linked", status_code=303)
         
     except Exception as e:
-        print(f"⚠️ Figma Auth Callback crashed: {e}")
+        log.error(f"⚠️ Figma Auth Callback crashed: {e}")
         return RedirectResponse("/dashboard?error=figma_auth_crash", status_code=303)
 
 # ==========================================================================
@@ -547,7 +1050,7 @@ PUBLIC_PAGES = {
 # In app.py
 from fastapi.staticfiles import StaticFiles # Make sure this is imported
 
-app.mount("/static", StaticFiles(directory="frontend/static"), name="static")
+app.mount("/static", CachedStaticFiles(directory="frontend/static"), name="static")
 
 # 1. ROOT ROUTE REDIRECT LOGIC
 @app.get("/")
@@ -565,24 +1068,37 @@ async def root_redirect(request: Request):
     # Default landing is now the signup page
     return RedirectResponse("/signup", status_code=303)
 
-# 2. GENERATE HANDLERS FOR OTHER PUBLIC PAGES
-for route, template_name in PUBLIC_PAGES.items():
-    # Skip creating a handler for root since we defined it manually above
-    if route == "/": continue
-
-    def make_handler(t_name):
-        async def handler(request: Request):
-            # Pass common variables like 'step' for signup flow
-            return templates.TemplateResponse(t_name, {"request": request, "step": "initial"})
-        return handler
-        
-    app.get(route, response_class=HTMLResponse)(make_handler(template_name))
+# 2. OTHER PUBLIC PAGES: one shared handler, registered per literal path so
+#    unknown paths, trailing-slash redirects and other methods behave as before.
+PUBLIC_PAGE_CACHE_CONTROL = "public, max-age=300"
+
+@lru_cache(maxsize=32)
+def _render_public_page(t_name: str) -> str:
+    # These templates never touch `request`, so the body is identical for every hit
+    return templates.get_template(t_name).render({"request": None, "step": "initial"})
+
+def _public_page_handler(t_name: str):
+    async def public_page():
+        # Pass common variables like 'step' for signup flow (baked into the cached render)
+        return HTMLResponse(_render_public_page(t_name), headers={"Cache-Control": PUBLIC_PAGE_CACHE_CONTROL})
+    return public_page
+
+for _page_path, _t_name in PUBLIC_PAGES.items():
+    app.add_api_route(_page_path, _public_page_handler(_t_name), methods=["GET"],
+                      response_class=HTMLResponse, include_in_schema=False)
+
+# Read once at import; every hit is served from memory and cached by the browser
+FAVICON_PATH = os.path.join(FRONTEND_DIR, "assets", "favicon.png")
+FAVICON_BYTES: Optional[bytes] = None
+if os.path.exists(FAVICON_PATH):
+    with open(FAVICON_PATH, "rb") as f:
+        FAVICON_BYTES = f.read()
+FAVICON_HEADERS = {"Cache-Control": "public, max-age=86400, immutable"}
 
 @app.get("/favicon.ico", include_in_schema=False)
 async def favicon():
-    p = os.path.join(FRONTEND_DIR, "assets", "favicon.png")
-    if os.path.exists(p): 
-        return FileResponse(p)
+    if FAVICON_BYTES is not None: 
+        return Response(content=FAVICON_BYTES, media_type="image/png", headers=FAVICON_HEADERS)
     raise HTTPException(status_code=404)
 
 
@@ -590,50 +1106,54 @@ async def favicon():
 # 📚 DOCUMENTATION ROUTES
 # ==========================================================================
 
+@lru_cache(maxsize=128)
+def _render_docs_page(page: str, premium: bool) -> str:
+    # docs/base.html only reads user.plan (for the golden "PRO" theme), so one
+    # rendered body per (page, premium) covers every visitor
+    return templates.get_template(f"docs/{page}.html").render({
+        "request": None,
+        "page": page,
+        "user": {"plan": "premium"} if premium else None,
+    })
+
+# The complete 42-page Gor://a Builder Master Architecture
+VALID_DOC_PAGES = frozenset({
+    # Part 1: Getting Started
+    "intro", "quickstart", "dashboard", "tiers", "account-settings",
+    
+    # Part 2: Agent Skills
+    "skills-overview", "visual-prefs", "ui-frameworks", "code-style", "agent-personality", "golden-rules",
+    
+    # Part 3: Designing & Prompting
+    "perfect-prompt", "image-references", "figma-overview", "figma-import", "ideas-chips",
+    
+    # Part 4: In-Browser IDE
+    "editor-interface", "webcontainers", "auto-healing", "manual-editing", "file-tree", "export-zip",
+    
+    # Part 5: Full-Stack & Databases
+    "backend-overview", "supabase-link", "db-provisioning", "sql-migrations", "db-healing",
+    
+    # Part 6: Built-In Integrations
+    "auth-gateway", "ai-integrations", "image-gen", "voice-stt", "bg-removal",
+    
+    # Part 7: Deployment Pipeline
+    "deploy-prep", "github-link", "vercel-opt", "github-push", "vercel-deploy",
+    
+    # Part 8: Economy & Tokens
+    "api-tokens", "error-402", "spin-wheel", "monke-negotiator", "enterprise-tier"
+})
+
 @app.get("/docs/{page}", response_class=HTMLResponse)
 async def docs_page(request: Request, page: str):
     
-    # The complete 42-page Gor://a Builder Master Architecture
-    valid_pages = [
-        # Part 1: Getting Started
-        "intro", "quickstart", "dashboard", "tiers", "account-settings",
-        
-        # Part 2: Agent Skills
-        "skills-overview", "visual-prefs", "ui-frameworks", "code-style", "agent-personality", "golden-rules",
-        
-        # Part 3: Designing & Prompting
-        "perfect-prompt", "image-references", "figma-overview", "figma-import", "ideas-chips",
-        
-        # Part 4: In-Browser IDE
-        "editor-interface", "webcontainers", "auto-healing", "manual-editing", "file-tree", "export-zip",
-        
-        # Part 5: Full-Stack & Databases
-        "backend-overview", "supabase-link", "db-provisioning", "sql-migrations", "db-healing",
-        
-        # Part 6: Built-In Integrations
-        "auth-gateway", "ai-integrations", "image-gen", "voice-stt", "bg-removal",
-        
-        # Part 7: Deployment Pipeline
-        "deploy-prep", "github-link", "vercel-opt", "github-push", "vercel-deploy",
-        
-        # Part 8: Economy & Tokens
-        "api-tokens", "error-402", "spin-wheel", "monke-negotiator", "enterprise-tier"
-    ]
-    
-    if page not in valid_pages:
+    if page not in VALID_DOC_PAGES:
         return RedirectResponse("/docs/intro")
         
     # Safely grab the user so the docs can render the golden "PRO" theme if applicable
     user = get_current_user_safe(request)
+    premium = bool(user and user.get("plan") == "premium")
         
-    return templates.TemplateResponse(
-        f"docs/{page}.html", 
-        {
-            "request": request, 
-            "page": page,
-            "user": user  # Injects user state into base.html
-        }
-    )
+    return HTMLResponse(_render_docs_page(page, premium))
 
 @app.get("/docs", response_class=HTMLResponse)
 async def docs_root():
@@ -661,28 +1181,101 @@ GITHUB_CLIENT_ID = os.getenv("GITHUB_CLIENT_ID")
 GITHUB_CLIENT_SECRET = os.getenv("GITHUB_CLIENT_SECRET")
 GITHUB_REDIRECT_URI = os.getenv("GITHUB_REDIRECT_URI")
 
-# Global memory for storing OTPs during signup flow
-PENDING_SIGNUPS = {}
+# Authorization URLs are fixed for the life of the process, so build them once.
+# None means the provider is not configured (logged here, 500 on the route).
+GOOGLE_AUTH_URL: Optional[str] = None
+if GOOGLE_CLIENT_ID and GOOGLE_REDIRECT_URI:
+    GOOGLE_AUTH_URL = "https://accounts.google.com/o/oauth2/v2/auth?" + urllib.parse.urlencode({
+        "response_type": "code",
+        "client_id": GOOGLE_CLIENT_ID,
+        "redirect_uri": GOOGLE_REDIRECT_URI,
+        "scope": "openid email profile",
+    }, quote_via=urllib.parse.quote)
+else:
+    log.warning("⚠️ Google OAuth disabled: GOOGLE_CLIENT_ID / GOOGLE_REDIRECT_URI not set")
+
+GITHUB_AUTH_URL: Optional[str] = None
+if GITHUB_CLIENT_ID and GITHUB_REDIRECT_URI:
+    # Scope 'repo' is REQUIRED to push code on the user's behalf
+    GITHUB_AUTH_URL = "https://github.com/login/oauth/authorize?" + urllib.parse.urlencode({
+        "client_id": GITHUB_CLIENT_ID,
+        "redirect_uri": GITHUB_REDIRECT_URI,
+        "scope": "user:email repo",
+    }, quote_via=urllib.parse.quote)
+else:
+    log.warning("⚠️ GitHub OAuth disabled: GITHUB_CLIENT_ID / GITHUB_REDIRECT_URI not set")
+
+# Verified access tokens: token -> (expiry timestamp, {"id", "email"}).
+# A given JWT always resolves to the same user, so we only ask Supabase once.
+_TOKEN_USER_CACHE: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+TOKEN_CACHE_TTL_SECONDS = 300
+TOKEN_CACHE_MAX_ENTRIES = 10000
+
+def _decode_access_token(token: str) -> Tuple[Optional[Dict[str, Any]], bool]:
+    """
+    Verifies a Supabase JWT locally (HS256 + project secret).
+    Returns (payload, decided). decided=False means we couldn't judge the
+    token offline (no secret / PyJWT, or a non-HS256 signing key) and the
+    caller should ask Supabase instead.
+    """
+    if not (jwt and SUPABASE_JWT_SECRET):
+        return None, False
+    try:
+        payload = jwt.decode(
+            token, SUPABASE_JWT_SECRET,
+            algorithms=["HS256"], audience="authenticated",
+        )
+        return payload, True
+    except (jwt.ExpiredSignatureError, jwt.InvalidSignatureError, jwt.InvalidAudienceError):
+        return None, True
+    except jwt.InvalidTokenError:
+        return None, False
+
+def _user_from_access_token(token: str) -> Optional[Dict[str, Any]]:
+    now = time.time()
+    cached = _TOKEN_USER_CACHE.get(token)
+    if cached and cached[0] > now:
+        return cached[1]
+
+    expires_at = now + TOKEN_CACHE_TTL_SECONDS
+    payload, decided = _decode_access_token(token)
+    if decided:
+        if not payload or not payload.get("sub"):
+            return None
+        user = {"id": payload["sub"], "email": payload.get("email")}
+        # Never serve a token from cache past its own expiry
+        expires_at = min(expires_at, float(payload.get("exp") or expires_at))
+    else:
+        res = supabase.auth.get_user(token)
+        auth_user = getattr(res, "user", None)
+        if not auth_user:
+            return None
+        user = {"id": auth_user.id, "email": auth_user.email}
+
+    if len(_TOKEN_USER_CACHE) >= TOKEN_CACHE_MAX_ENTRIES:
+        _TOKEN_USER_CACHE.pop(next(iter(_TOKEN_USER_CACHE)), None)
+    _TOKEN_USER_CACHE[token] = (expires_at, user)
+    return user
 
 def get_current_user_safe(request: Request):
     """
     Helper to safely check for a user session without raising an exception.
     Used for the root redirect logic.
     """
+    # Session first: it's in-process and covers every login path
+    user = request.session.get("user")
+    if user:
+        return user
+
+    # Fallback to the Supabase cookie (token lookups are cached). Anonymous
+    # visitors have no cookie and never reach the exception path.
+    token = request.cookies.get("sb_access_token")
+    if not token:
+        return None
     try:
-        # Check Supabase cookie first
-        token = request.cookies.get("sb_access_token")
-        if token:
-             user = supabase.auth.get_user(token)
-             if user: return user
-        
-        # Fallback to session (for dev/google/github auth) if used
-        if "user" in request.session:
-            return request.session["user"]
-            
-    except:
-        pass
-    return None
+        return _user_from_access_token(token)
+    except Exception:
+        return None
 
 def _ensure_gorilla_api_key(user_id: str):
     """
@@ -695,9 +1288,14 @@ def _ensure_gorilla_api_key(user_id: str):
             # Generate a secure 48-character hex string (total key length ~56 chars)
             new_key = f"gb_live_{secrets.token_hex(24)}"
             supabase.table("users").update({"gorilla_api_key": new_key}).eq("id", user_id).execute()
-            print(f"🔑 Generated new Gorilla API Key for user: {user_id}")
+            log.info(f"🔑 Generated new Gorilla API Key for user: {user_id}")
     except Exception as e:
-        print(f"⚠️ Failed to generate gorilla_api_key for {user_id}: {e}")
+        log.warning(f"⚠️ Failed to generate gorilla_api_key for {user_id}: {e}")
+
+def _sync_logged_in_user(user_id: str, email: str) -> None:
+    """Post-login DB sync: public.users row first, then the AI proxy key that lives on it."""
+    ensure_public_user(user_id, email)
+    _ensure_gorilla_api_key(user_id)
 
 # --------------------------------------------------------------------------
 # 1. SIGNUP FLOW (Secure)
@@ -706,7 +1304,6 @@ def _ensure_gorilla_api_key(user_id: str):
 @app.post("/auth/signup")
 async def auth_signup_init(
     request: Request, 
-    background_tasks: BackgroundTasks,
     email: str = Form(...), 
     password: str = Form(...)
 ):
@@ -714,11 +1311,9 @@ async def auth_signup_init(
     
     # [SECURITY] Check if user already exists
     try:
-        # Admin check is most reliable. If not available, use a safe alternative.
-        existing_users = supabase.auth.admin.list_users()
-        user_exists = any(u.email == email for u in existing_users)
+        providers = await asyncio.to_thread(_auth_user_providers, email)
         
-        if user_exists:
+        if providers is not None:
             # REDIRECT TO LOGIN if account exists
             return templates.TemplateResponse(
                 "auth/login.html", 
@@ -729,20 +1324,37 @@ async def auth_signup_init(
                 }
             )
     except Exception as e:
-        print(f"⚠️ User existence check warning: {e}")
+        log.warning(f"⚠️ User existence check warning: {e}")
         pass # Fail open or closed depending on policy, passing allows flow to continue
 
     # Proceed with OTP generation
     otp = "".join(random.choices(string.digits, k=6))
     
-    PENDING_SIGNUPS[email] = {
-        "password": password,
-        "otp": otp,
-        "ts": time.time()
-    }
+    async with _PENDING_SIGNUPS_LOCK:
+        now = time.time()
+        # Lazy sweep: drop expired signups, then the oldest if still over cap
+        while PENDING_SIGNUPS:
+            oldest = next(iter(PENDING_SIGNUPS.values()))
+            if (now - oldest["ts"] <= PENDING_SIGNUP_TTL_SECONDS
+                    and len(PENDING_SIGNUPS) < PENDING_SIGNUPS_MAX):
+                break
+            PENDING_SIGNUPS.popitem(last=False)
+
+        # Re-requesting a code moves the email to the newest position.
+        # The password is kept as-is: create_user() needs it on verify.
+        PENDING_SIGNUPS.pop(email, None)
+        PENDING_SIGNUPS[email] = {
+            "password": password,
+            "otp": otp,
+            "ts": now
+        }
     
-    # --- FIX: SEND ACTUAL EMAIL VIA BACKGROUND TASK ---
-    background_tasks.add_task(send_otp_email, email, otp)
+    # --- FIX: SEND ACTUAL EMAIL VIA THE OTP WORKER ---
+    if not enqueue_otp_email(email, otp):
+        # Never sent, so don't leave a code nobody can receive
+        async with _PENDING_SIGNUPS_LOCK:
+            PENDING_SIGNUPS.pop(email, None)
+        return templates.TemplateResponse("auth/signup.html", {"request": request, "step": "initial", "error": "We couldn't send your code right now. Please try again in a minute."})
     
     return templates.TemplateResponse(
         "auth/signup.html", 
@@ -756,19 +1368,39 @@ async def auth_signup_init(
 @app.post("/auth/verify")
 async def auth_verify_otp(
     request: Request,
+    background_tasks: BackgroundTasks,
     email: str = Form(...),
     code: str = Form(...)
 ):
     email = email.strip().lower()
-    record = PENDING_SIGNUPS.get(email)
-    
-    # 1. Validate Session
-    if not record:
-        return templates.TemplateResponse("auth/signup.html", {"request": request, "step": "initial", "error": "Session expired. Please start over."})
-    
-    # 2. Validate OTP
-    if record["otp"] != code:
-        return templates.TemplateResponse("auth/signup.html", {"request": request, "step": "verify", "email": email, "error": "Invalid code."})
+    async with _PENDING_SIGNUPS_LOCK:
+        record = PENDING_SIGNUPS.get(email)
+        if record and time.time() - record["ts"] > PENDING_SIGNUP_TTL_SECONDS:
+            PENDING_SIGNUPS.pop(email, None)
+            record = None
+        
+        # 1. Validate Session
+        if not record:
+            return templates.TemplateResponse("auth/signup.html", {"request": request, "step": "initial", "error": "Session expired. Please start over."})
+        
+        # 2. Validate OTP (constant-time compare)
+        if not hmac.compare_digest(record["otp"].encode(), (code or "").strip().encode()):
+            return templates.TemplateResponse("auth/signup.html", {"request": request, "step": "verify", "email": email, "error": "Invalid code."})
+
+        # Claim the signup so a concurrent verify for this email can't reuse it.
+        # It's only deleted once the account exists, so a transient failure can retry.
+        if record.get("claimed"):
+            return templates.TemplateResponse("auth/signup.html", {"request": request, "step": "verify", "email": email, "error": "Verification already in progress."})
+        record["claimed"] = True
+
+    async def release_signup(consumed: bool) -> None:
+        async with _PENDING_SIGNUPS_LOCK:
+            if consumed:
+                # Only drop our own record; a resend may have replaced it
+                if PENDING_SIGNUPS.get(email) is record:
+                    PENDING_SIGNUPS.pop(email, None)
+            else:
+                record["claimed"] = False
     
     try:
         password = record["password"]
@@ -782,6 +1414,7 @@ async def auth_verify_otp(
             })
         except Exception as e:
             # Should be caught by the initial check, but strictly handle race conditions
+            await release_signup(consumed=True)
             return templates.TemplateResponse("auth/login.html", {"request": request, "error": "Account exists. Please log in."})
 
         # 4. Auto-Login
@@ -792,17 +1425,12 @@ async def auth_verify_otp(
 
         if not res.session:
             raise Exception("Account created, but auto-login failed.")
+        await release_signup(consumed=True)
 
-        # 5. Sync Public DB
-        ensure_public_user(res.user.id, email)
-        
-        # 🚨 AI PROXY: Generate their Master Key
-        _ensure_gorilla_api_key(res.user.id)
-        
-        # 6. Cleanup & Response
-        if email in PENDING_SIGNUPS:
-            del PENDING_SIGNUPS[email]
+        # 5. Sync Public DB + 🚨 AI PROXY Master Key (after the redirect is sent)
+        background_tasks.add_task(_sync_logged_in_user, res.user.id, email)
         
+        # 6. Response
         # FIX: Force session set to avoid dev@local fallback
         request.session["user"] = {"id": res.user.id, "email": email}
 
@@ -817,7 +1445,8 @@ async def auth_verify_otp(
         return response
         
     except Exception as e:
-        print(f"Verify Error: {e}")
+        log.error(f"Verify Error: {e}")
+        await release_signup(consumed=False)
         return templates.TemplateResponse("auth/signup.html", {"request": request, "step": "verify", "email": email, "error": "System error. Try again."})
 
 # --------------------------------------------------------------------------
@@ -825,7 +1454,7 @@ async def auth_verify_otp(
 # --------------------------------------------------------------------------
 
 @app.post("/auth/login")
-async def login(request: Request, email: str = Form(...), password: str = Form(...)):
+async def login(request: Request, background_tasks: BackgroundTasks, email: str = Form(...), password: str = Form(...)):
     try:
         # 1. Attempt Real Authentication against Supabase
         res = supabase.auth.sign_in_with_password({
@@ -839,11 +1468,8 @@ async def login(request: Request, email: str = Form(...), password: str = Form(.
 
         # FIX: Force session set to avoid dev@local fallback
         request.session["user"] = {"id": res.user.id, "email": email}
-        # FIX: Ensure user is synced
-        ensure_public_user(res.user.id, email)
-        
-        # 🚨 AI PROXY: Ensure they have a Master Key
-        _ensure_gorilla_api_key(res.user.id)
+        # FIX: Ensure user is synced + 🚨 AI PROXY Master Key (after the redirect is sent)
+        background_tasks.add_task(_sync_logged_in_user, res.user.id, email)
 
         # 2. Success: Set Cookie & Redirect
         response = RedirectResponse("/dashboard", status_code=303)
@@ -857,20 +1483,16 @@ async def login(request: Request, email: str = Form(...), password: str = Form(.
         return response
 
     except Exception as e:
-        print(f"❌ Login Failed for {email}: {e}")
+        log.error(f"❌ Login Failed for {email}: {e}")
         
         # 3. Security Analysis: Determine why it failed
         error_msg = "Invalid email or password."
         
         try:
             # Check if user exists but uses Google/GitHub Auth (Passwordless)
-            users = supabase.auth.admin.list_users()
-            target_user = next((u for u in users if u.email == email), None)
+            providers = await asyncio.to_thread(_auth_user_providers, email)
             
-            if target_user:
-                identities = getattr(target_user, "identities", [])
-                providers = [i.provider for i in identities]
-                
+            if providers is not None:
                 # If they only have OAuth and no password set
                 if "google" in providers and "email" not in providers:
                     error_msg = "This account uses Google Login. Please click 'Continue with Google'."
@@ -878,7 +1500,7 @@ async def login(request: Request, email: str = Form(...), password: str = Form(.
                     error_msg = "This account uses GitHub Login. Please click 'Continue with GitHub'."
                 elif "google" in providers or "github" in providers:
                     error_msg = "Invalid password. Try logging in with your connected OAuth provider."
-        except:
+        except Exception:
             pass # Keep generic error if admin check fails
 
         # 4. STRICT FAILURE: Return to login page with error
@@ -888,15 +1510,21 @@ async def login(request: Request, email: str = Form(...), password: str = Form(.
             "email_prefill": email
         })
 
+def _safe_sign_out() -> None:
+    try:
+        supabase.auth.sign_out()
+    except Exception:
+        pass
+
 @app.get("/auth/logout")
-async def logout(request: Request):
+async def logout(request: Request, background_tasks: BackgroundTasks):
     # Redirect to signup on logout
     response = RedirectResponse("/signup", status_code=303)
     response.delete_cookie("sb_access_token")
+    _USER_ENSURED.pop((request.session.get("user") or {}).get("id"), None)
     request.session.clear()
-    try:
-        supabase.auth.sign_out()
-    except: pass
+    # Best-effort server-side sign-out, after the redirect is sent
+    background_tasks.add_task(_safe_sign_out)
     return response
 
 # --------------------------------------------------------------------------
@@ -920,53 +1548,78 @@ async def forgot_password_action(request: Request, email: str = Form(...)):
 # 4. GOOGLE OAUTH
 # --------------------------------------------------------------------------
 
+def _google_id_token_claims(tokens: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Reads the claims out of the id_token Google returns with the token
+    exchange (we asked for the `openid` scope). The token came straight from
+    Google's token endpoint over TLS, so per OIDC Core §3.1.3.7 the signature
+    check can be skipped. Returns {} if there is no usable id_token.
+    """
+    id_token = tokens.get("id_token") or ""
+    try:
+        payload = id_token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        return json.loads(base64.urlsafe_b64decode(payload))
+    except (IndexError, ValueError):
+        return {}
+
+async def _google_user_from_tokens(client: httpx.AsyncClient, tokens: Dict[str, Any]) -> Dict[str, Any]:
+    """userinfo-shaped dict (id, email, name, picture) for a Google login."""
+    claims = _google_id_token_claims(tokens)
+    if claims.get("email"):
+        return {
+            "id": claims.get("sub"),
+            "email": claims.get("email"),
+            "name": claims.get("name"),
+            "picture": claims.get("picture"),
+        }
+
+    # No id_token (or no email claim): fall back to the userinfo endpoint
+    user_res = await client.get(
+        "https://www.googleapis.com/oauth2/v1/userinfo",
+        headers={"Authorization": f"Bearer {tokens.get('access_token')}"}
+    )
+    return orjson.loads(user_res.content)
+
 @app.get("/auth/google")
 async def auth_google(request: Request):
-    if not GOOGLE_CLIENT_ID or not GOOGLE_REDIRECT_URI:
+    if GOOGLE_AUTH_URL is None:
         raise HTTPException(500, "Google Auth config missing.")
-    scope = "openid email profile"
-    auth_url = f"https://accounts.google.com/o/oauth2/v2/auth?response_type=code&client_id={GOOGLE_CLIENT_ID}&redirect_uri={GOOGLE_REDIRECT_URI}&scope={scope}"
-    return RedirectResponse(auth_url)
+    return RedirectResponse(GOOGLE_AUTH_URL)
 
 @app.get("/auth/google/callback")
 async def auth_google_callback(request: Request, code: str):
     if not GOOGLE_CLIENT_ID or not GOOGLE_CLIENT_SECRET:
         raise HTTPException(500, "Google Auth config missing.")
     
-    async with httpx.AsyncClient() as client:
-        res = await client.post("https://oauth2.googleapis.com/token", data={
-            "code": code,
-            "client_id": GOOGLE_CLIENT_ID,
-            "client_secret": GOOGLE_CLIENT_SECRET,
-            "redirect_uri": GOOGLE_REDIRECT_URI,
-            "grant_type": "authorization_code",
-        })
-        
-        if res.status_code != 200:
-             raise HTTPException(400, "Google Login Failed")
-        
-        tokens = res.json()
-        access_token = tokens.get("access_token")
-        
-        user_res = await client.get(
-            "https://www.googleapis.com/oauth2/v1/userinfo", 
-            headers={"Authorization": f"Bearer {access_token}"}
-        )
-        user_data = user_res.json()
-        email = user_data.get("email")
-        
-        if not email:
-            raise HTTPException(400, "No email from Google")
+    client = _http()
+    res = await client.post("https://oauth2.googleapis.com/token", data={
+        "code": code,
+        "client_id": GOOGLE_CLIENT_ID,
+        "client_secret": GOOGLE_CLIENT_SECRET,
+        "redirect_uri": GOOGLE_REDIRECT_URI,
+        "grant_type": "authorization_code",
+    })
+    
+    if res.status_code != 200:
+         raise HTTPException(400, "Google Login Failed")
+    
+    tokens = orjson.loads(res.content)
+    user_data = await _google_user_from_tokens(client, tokens)
+    email = user_data.get("email")
+    
+    if not email:
+        raise HTTPException(400, "No email from Google")
 
-        user_id = _stable_user_id_for_email(email)
-        ensure_public_user(user_id, email)
-        
-        # 🚨 AI PROXY: Ensure they have a Master Key
-        _ensure_gorilla_api_key(user_id)
-        
-        request.session["user"] = {"id": user_id, "email": email}
-        
-        return RedirectResponse("/dashboard", status_code=303)
+    user_id = _stable_user_id_for_email(email)
+    ensure_public_user(user_id, email)
+    
+    # 🚨 AI PROXY: Ensure they have a Master Key
+    _ensure_gorilla_api_key(user_id)
+    
+    request.session["user"] = {"id": user_id, "email": email}
+    
+    return RedirectResponse("/dashboard", status_code=303)
 
 # --------------------------------------------------------------------------
 # 5. GITHUB OAUTH (Crucial for Vercel Deployment pipeline)
@@ -974,107 +1627,90 @@ async def auth_google_callback(request: Request, code: str):
 
 @app.get("/auth/github")
 async def auth_github(request: Request):
-    if not GITHUB_CLIENT_ID or not GITHUB_REDIRECT_URI:
+    if GITHUB_AUTH_URL is None:
         raise HTTPException(500, "GitHub Auth config missing.")
-    
-    # Scope 'repo' is REQUIRED to push code on the user's behalf
-    scope = "user:email repo"
-    auth_url = f"https://github.com/login/oauth/authorize?client_id={GITHUB_CLIENT_ID}&redirect_uri={GITHUB_REDIRECT_URI}&scope={scope}"
-    return RedirectResponse(auth_url)
+    return RedirectResponse(GITHUB_AUTH_URL)
 
 @app.get("/auth/github/callback")
 async def auth_github_callback(request: Request, code: str):
     if not GITHUB_CLIENT_ID or not GITHUB_CLIENT_SECRET:
         raise HTTPException(500, "GitHub Auth config missing.")
     
-    async with httpx.AsyncClient() as client:
-        # 1. Exchange code for GitHub Access Token
-        res = await client.post(
-            "https://github.com/login/oauth/access_token", 
-            data={
-                "client_id": GITHUB_CLIENT_ID,
-                "client_secret": GITHUB_CLIENT_SECRET,
-                "code": code,
-                "redirect_uri": GITHUB_REDIRECT_URI
-            },
-            headers={"Accept": "application/json"}
-        )
-        
-        if res.status_code != 200:
-             raise HTTPException(400, "GitHub Login Failed")
-        
-        tokens = res.json()
-        access_token = tokens.get("access_token")
-        
-        if not access_token:
-            error_msg = tokens.get("error_description", "Failed to retrieve GitHub access token")
-            raise HTTPException(400, error_msg)
-
-        # 2. Get User Profile Data
-        user_res = await client.get(
-            "https://api.github.com/user", 
-            headers={
-                "Authorization": f"Bearer {access_token}",
-                "Accept": "application/vnd.github.v3+json"
-            }
-        )
-        user_data = user_res.json()
-        email = user_data.get("email")
-        github_username = user_data.get("login", "unknown_github_user") # Grab their username just in case!
-
-        # 3. If primary email is private, hit the emails endpoint directly
-        if not email:
-            emails_res = await client.get(
-                "https://api.github.com/user/emails",
-                headers={
-                    "Authorization": f"Bearer {access_token}",
-                    "Accept": "application/vnd.github.v3+json"
-                }
-            )
-            if emails_res.status_code == 200:
-                emails_data = emails_res.json()
-                if isinstance(emails_data, list):
-                    # Attempt A: Find the Primary & Verified email
-                    for em in emails_data:
-                        if isinstance(em, dict) and em.get("primary") and em.get("verified"):
-                            email = em.get("email")
-                            break
-                    
-                    # Attempt B: Just find ANY Verified email
-                    if not email:
-                        for em in emails_data:
-                            if isinstance(em, dict) and em.get("verified"):
-                                email = em.get("email")
-                                break
-                    
-                    # Attempt C: Just take the very first email they have listed
-                    if not email and len(emails_data) > 0 and isinstance(emails_data[0], dict):
-                        email = emails_data[0].get("email")
-
-        # 🚨 4. THE ULTIMATE FALLBACK 🚨
-        # If their privacy settings are on maximum lockdown, we build a proxy email
-        # so they can still create an account and build apps!
-        if not email:
-            email = f"{github_username}@noreply.github.com"
-
-        # 5. Sync User in Database
-        user_id = _stable_user_id_for_email(email)
-        ensure_public_user(user_id, email)
-        
-        # 🚨 AI PROXY: Ensure they have a Master Key
-        _ensure_gorilla_api_key(user_id)
-        
-        # 6. Store the GitHub access token so we can push code later
-        try:
-            supabase.table("users").update({"github_access_token": access_token}).eq("id", user_id).execute()
-        except Exception as e:
-            print(f"⚠️ Failed to save github_access_token for {email}: {e}")
+    client = _http()
+    # 1. Exchange code for GitHub Access Token
+    res = await client.post(
+        "https://github.com/login/oauth/access_token", 
+        data={
+            "client_id": GITHUB_CLIENT_ID,
+            "client_secret": GITHUB_CLIENT_SECRET,
+            "code": code,
+            "redirect_uri": GITHUB_REDIRECT_URI
+        },
+        headers={"Accept": "application/json"}
+    )
+    
+    if res.status_code != 200:
+         raise HTTPException(400, "GitHub Login Failed")
+    
+    tokens = orjson.loads(res.content)
+    access_token = tokens.get("access_token")
+    
+    if not access_token:
+        error_msg = tokens.get("error_description", "Failed to retrieve GitHub access token")
+        raise HTTPException(400, error_msg)
+
+    # 2. Get User Profile Data (+ emails speculatively, on the same pooled connection)
+    gh_headers = {
+        "Authorization": f"Bearer {access_token}",
+        "Accept": "application/vnd.github.v3+json"
+    }
+    user_res, emails_res = await asyncio.gather(
+        client.get("https://api.github.com/user", headers=gh_headers),
+        client.get("https://api.github.com/user/emails", headers=gh_headers),
+    )
+    user_data = orjson.loads(user_res.content)
+    email = user_data.get("email")
+    github_username = user_data.get("login", "unknown_github_user") # Grab their username just in case!
+
+    # 3. If primary email is private, use the emails endpoint
+    if not email:
+        if emails_res.status_code == 200:
+            emails_data = orjson.loads(emails_res.content)
+            if isinstance(emails_data, list):
+                # One pass: Primary & Verified > any Verified > first listed
+                # (max keeps the first of equally ranked entries)
+                best = max(
+                    (em for em in emails_data if isinstance(em, dict) and em.get("email")),
+                    key=lambda em: (bool(em.get("primary") and em.get("verified")), bool(em.get("verified"))),
+                    default=None,
+                )
+                if best:
+                    email = best["email"]
+
+    # 🚨 4. THE ULTIMATE FALLBACK 🚨
+    # If their privacy settings are on maximum lockdown, we build a proxy email
+    # so they can still create an account and build apps!
+    if not email:
+        email = f"{github_username}@noreply.github.com"
+
+    # 5. Sync User in Database
+    user_id = _stable_user_id_for_email(email)
+    ensure_public_user(user_id, email)
+    
+    # 🚨 AI PROXY: Ensure they have a Master Key
+    _ensure_gorilla_api_key(user_id)
+    
+    # 6. Store the GitHub access token so we can push code later
+    try:
+        supabase.table("users").update({"github_access_token": access_token}).eq("id", user_id).execute()
+    except Exception as e:
+        log.warning(f"⚠️ Failed to save github_access_token for {email}: {e}")
 
-        # 7. Finalize Login
-        request.session["user"] = {"id": user_id, "email": email}
-        
-        return RedirectResponse("/dashboard", status_code=303)
-        
+    # 7. Finalize Login
+    request.session["user"] = {"id": user_id, "email": email}
+    
+    return RedirectResponse("/dashboard", status_code=303)
+    
 # ==========================================================================
 # BILLING ROUTES (Mock Payment Processing)
 # ==========================================================================
@@ -1157,7 +1793,7 @@ async def auth_supabase_callback(request: Request, code: str, state: str):
             
             # 🛑 THE FIX: Allow 201 Created in addition to 200 OK
             if res.status_code not in [200, 201]:
-                print(f"⚠️ Supabase OAuth Error ({res.status_code}): {res.text}")
+                log.error(f"⚠️ Supabase OAuth Error ({res.status_code}): {res.text}")
                 return RedirectResponse("/dashboard?error=supabase_token_exchange_failed", status_code=303)
                 
             tokens = res.json()
@@ -1170,12 +1806,12 @@ async def auth_supabase_callback(request: Request, code: str, state: str):
                     "supabase_access_token": access_token,
                     "supabase_refresh_token": refresh_token
                 }).eq("id", user["id"]).execute()
-                print(f"✅ Supabase tokens successfully saved for user {user['id']}")
+                log.info(f"✅ Supabase tokens successfully saved for user {user['id']}")
                 
         return RedirectResponse("/dashboard?success=supabase_linked", status_code=303)
         
     except Exception as e:
-        print(f"⚠️ Supabase Auth Callback crashed: {e}")
+        log.error(f"⚠️ Supabase Auth Callback crashed: {e}")
         return RedirectResponse("/dashboard?error=supabase_auth_crash", status_code=303)
 
 # ==========================================================================
@@ -1190,40 +1826,54 @@ from fastapi.responses import HTMLResponse, JSONResponse
 async def dashboard(request: Request):
     user = get_current_user(request)
     
-    # Fetch latest Plan, Agent Skills, and Last Spin Date from DB
+    def _fetch_profile():
+        try:
+            res = supabase.table("users").select("plan, agent_skills, last_spin_date").eq("id", user["id"]).single().execute()
+            return res.data if res else None
+        except Exception:
+            return None
+
+    def _fetch_projects():
+        try:
+            # Only what dashboard.html renders (snapshot_b64 is the card thumbnail)
+            res = (
+                supabase.table("projects")
+                .select("id, name, description, updated_at, snapshot_b64")
+                .eq("owner_id", user["id"])
+                .order("updated_at", desc=True)
+                .execute()
+            )
+            projects = res.data if res and res.data else []
+            # Full list in hand -> exact count for the next create's quota check
+            _remember_project_count(user["id"], len(projects))
+            return projects
+        except Exception:
+            return []
+
+    # The three reads are independent: run them side by side
+    profile, (used, limit), projects = await asyncio.gather(
+        asyncio.to_thread(_fetch_profile),
+        asyncio.to_thread(get_token_usage_and_limit, user["id"]),
+        asyncio.to_thread(_fetch_projects),
+    )
+
+    # Latest Plan, Agent Skills, and Last Spin Date from DB
     has_skills = False
     last_spin_date = None
-    try:
-        res = supabase.table("users").select("plan, agent_skills, last_spin_date").eq("id", user["id"]).single().execute()
-        if res and res.data:
-            user["plan"] = res.data.get("plan", "free")
-            last_spin_date = res.data.get("last_spin_date")
-            if res.data.get("agent_skills"):
-                has_skills = True
-    except Exception:
+    if profile:
+        user["plan"] = profile.get("plan", "free")
+        last_spin_date = profile.get("last_spin_date")
+        if profile.get("agent_skills"):
+            has_skills = True
+    else:
         user["plan"] = "free"
     
     # Token Data
-    used, limit = get_token_usage_and_limit(user["id"])
     user["tokens"] = {
         "used": used, 
         "limit": limit, 
         "remaining": max(0, limit - used)
     }
-    
-    # Project Data
-    try:
-        # select("*") automatically pulls the new snapshot_b64 column
-        res = (
-            supabase.table("projects")
-            .select("*")
-            .eq("owner_id", user["id"])
-            .order("updated_at", desc=True)
-            .execute()
-        )
-        projects = res.data if res and res.data else []
-    except Exception:
-        projects = []
 
     return templates.TemplateResponse(
         "dashboard/dashboard.html", 
@@ -1327,7 +1977,7 @@ async def settings_page(request: Request):
             user["has_supabase"] = False
             
     except Exception as e:
-        print(f"Error loading settings: {e}")
+        log.error(f"Error loading settings: {e}")
         user["plan"] = "free"
         user["gorilla_api_key"] = ""
         
@@ -1385,8 +2035,7 @@ async def save_agent_skills(request: Request):
         supabase.table("users").update({"agent_skills": payload}).eq("id", user["id"]).execute()
         return JSONResponse({"status": "success", "message": "Skills saved successfully"})
     except Exception as e:
-        import traceback
-        traceback.print_exc()
+        log.exception("❌ Saving agent skills failed")
         return JSONResponse({"detail": f"Failed to save skills: {str(e)}"}, status_code=500)
 
 
@@ -1399,12 +2048,9 @@ import urllib.parse
 import re
 import os
 import asyncio
-import traceback
 import json
 import time
 import mimetypes
-import tempfile
-import subprocess
 import base64 # Added for handling image data
 import httpx # Needed for the background task API call
 from typing import Dict, Any, List, Optional
@@ -1416,7 +2062,7 @@ async def generate_project_snapshot(project_id: str, prompt: str, user_api_key:
     try:
         proxy_base = os.getenv("FILE_API_BASE_URL", "").rstrip("/")
         if not proxy_base:
-            print(f"FILE_API_BASE_URL not set; skipping snapshot for {project_id}")
+            log.warning(f"FILE_API_BASE_URL not set; skipping snapshot for {project_id}")
             return
         payload = {"prompt": f"Professional web UI dashboard preview: {prompt}", "samples": 1}
         headers = {
@@ -1430,7 +2076,7 @@ async def generate_project_snapshot(project_id: str, prompt: str, user_api_key:
                 json=payload, headers=headers, timeout=60.0,
             )
             if resp.status_code != 200:
-                print(f"Proxy Error ({resp.status_code}): {resp.text}")
+                log.error(f"Proxy Error ({resp.status_code}): {resp.text}")
                 return
             data = resp.json()
             snapshot_b64_data = None
@@ -1447,9 +2093,9 @@ async def generate_project_snapshot(project_id: str, prompt: str, user_api_key:
                 supabase.table("projects").update(
                     {"snapshot_b64": snapshot_b64_data}
                 ).eq("id", project_id).execute()
-                print(f"Snapshot saved for {project_id}")
+                log.info(f"Snapshot saved for {project_id}")
     except Exception as e:
-        print(f"Snapshot task crashed: {e}")
+        log.error(f"Snapshot task crashed: {e}")
 
 # 1. CREATE PAGE (Stash prompt in session & detect Figma)
 @app.get("/projects/createit", response_class=HTMLResponse)
@@ -1476,11 +2122,92 @@ async def project_create_page(request: Request, prompt: Optional[str] = None):
 
 # 2. CREATE ACTION (Backend Insert)
 from backend.figma_import import fetch_and_compress_figma, compile_figma_to_react
+from concurrent.futures import ThreadPoolExecutor
 import re
 import urllib.parse
 import asyncio
 import os
 
+# Slug / name sanitizers shared by project create, Supabase provisioning and GitHub publish
+_SLUG_UNSAFE_RE = re.compile(r"[^a-z0-9-]")
+_DB_NAME_UNSAFE_RE = re.compile(r"[^a-zA-Z0-9 ]")
+
+BOILERPLATE_READ_WORKERS = 16
+BOILERPLATE_INSERT_CHUNK = 50
+BOILERPLATE_SKIP_DIRS = frozenset({"node_modules", ".git", "dist", "build"})
+
+def _walk_boilerplate(root: str) -> List[Tuple[str, int]]:
+    """(abs_path, size) for every non-dot file, same top-down order as os.walk."""
+    found: List[Tuple[str, int]] = []
+    subdirs: List[str] = []
+    with os.scandir(root) as it:
+        for entry in it:
+            if entry.is_dir():
+                if entry.name not in BOILERPLATE_SKIP_DIRS:
+                    subdirs.append(entry.path)
+            elif entry.is_file() and not entry.name.startswith("."):
+                found.append((entry.path, entry.stat().st_size))
+    for d in subdirs:
+        found.extend(_walk_boilerplate(d))
+    return found
+
+def _read_text_file(item: Tuple[str, int]) -> Optional[str]:
+    """UTF-8 text of a boilerplate file, or None for binary/unreadable files (skipped)."""
+    abs_path, size = item
+    try:
+        fd = os.open(abs_path, os.O_RDONLY)
+        try:
+            # One read sized from the scandir stat; loop only if the file grew
+            chunks = [os.read(fd, size + 1)]
+            while chunks[-1]:
+                chunks.append(os.read(fd, 65536))
+        finally:
+            os.close(fd)
+        return b"".join(chunks).decode("utf-8")
+    except (OSError, UnicodeDecodeError):
+        return None
+
+@lru_cache(maxsize=1)
+def _load_boilerplate_rows() -> Tuple[Tuple[str, str], ...]:
+    """
+    (rel_path, content) for every text file in the boilerplate. The tree only
+    changes between deploys, so it is read from disk once per process.
+    """
+    entries = _walk_boilerplate(BOILERPLATE_DIR)
+
+    # Overlap the file reads instead of paying them one after another
+    with ThreadPoolExecutor(max_workers=max(1, min(BOILERPLATE_READ_WORKERS, len(entries)))) as ex:
+        contents = list(ex.map(_read_text_file, entries))
+
+    rows = []
+    for (abs_path, _), content in zip(entries, contents):
+        if content is None:
+            continue
+        rel_path = os.path.relpath(abs_path, BOILERPLATE_DIR).replace("\\\\", "/")
+        rows.append((rel_path, content))
+    return tuple(rows)
+
+def _json_row_tail(path: str, content: str) -> bytes:
+    return b'"path":' + orjson.dumps(path) + b',"content":' + orjson.dumps(content) + b"}"
+
+@lru_cache(maxsize=1)
+def _load_boilerplate_json_rows() -> Tuple[Tuple[str, str, bytes], ...]:
+    """
+    (rel_path, content, encoded) where `encoded` is the row's JSON tail
+    `"path":...,"content":...}`. Escaping ~70 unchanged files happens once;
+    a create only prefixes its project_id onto each fragment.
+    """
+    return tuple(
+        (rel_path, content, _json_row_tail(rel_path, content))
+        for rel_path, content in _load_boilerplate_rows()
+    )
+
+@app.on_event("startup")
+async def _warm_boilerplate_rows():
+    # Pay the one-time tree read at boot, not inside the first user's /projects/create
+    if BOILERPLATE_EXISTS:
+        await asyncio.to_thread(_load_boilerplate_json_rows)
+
 @app.post("/projects/create")
 async def create_project(
     request: Request,
@@ -1496,9 +2223,25 @@ async def create_project(
     user = get_current_user(request)
  
     def check_project_limit():
+        cached = _cached_project_count(user["id"])
+        if cached is not None and cached < FREE_PROJECT_LIMIT:
+            return None
+        # One RPC: the count, plus the project list only when over the limit
+        try:
+            res = supabase.rpc("check_project_quota", {"p_owner_id": user["id"], "p_limit": FREE_PROJECT_LIMIT}).execute()
+            quota = res.data or {}
+            count = quota.get("count") or 0
+            _remember_project_count(user["id"], count)
+            if count >= FREE_PROJECT_LIMIT:
+                return quota.get("projects") or []
+            return None
+        except Exception as e:
+            log.warning(f"⚠️ check_project_quota RPC failed, using count query: {e}")
+
         res = supabase.table("projects").select("id", count="exact").eq("owner_id", user["id"]).execute()
         count = res.count if hasattr(res, "count") and res.count is not None else len(res.data)
-        if count >= 3:
+        _remember_project_count(user["id"], count)
+        if count >= FREE_PROJECT_LIMIT:
             return supabase.table("projects").select("*").eq("owner_id", user["id"]).order("created_at", desc=True).execute().data
         return None
  
@@ -1512,7 +2255,7 @@ async def create_project(
                     "error": "Free Limit Reached (3/3). Upgrade to Pro.",
                 })
         except Exception as e:
-            print(f"Project limit check failed: {e}")
+            log.warning(f"Project limit check failed: {e}")
  
     # --- 2. PROMPT STASHING ---
     if prompt and not name:
@@ -1589,7 +2332,7 @@ async def create_project(
                         org_id = new_org.get("id")
                     if org_id:
                         db_pass = secrets.token_urlsafe(16)
-                        safe_db_name = re.sub(r"[^a-zA-Z0-9 ]", "", project_name)[:32].strip() or "Gorilla App"
+                        safe_db_name = _DB_NAME_UNSAFE_RE.sub("", project_name)[:32].strip() or "Gorilla App"
                         proj_res = client.post(
                             "https://api.supabase.com/v1/projects", headers=headers,
                             json={
@@ -1623,7 +2366,7 @@ async def create_project(
                                 f"VITE_SUPABASE_ANON_KEY={supa_anon_key}\\n"
                             )
             except Exception as e:
-                print(f"Supabase provisioning failed: {e}")
+                log.warning(f"Supabase provisioning failed: {e}")
  
         # 4B. GEMINI FIGMA COMPILER
         if final_figma_json:
@@ -1636,7 +2379,7 @@ async def create_project(
                     if figma_tokens_used:
                         add_monthly_tokens(user["id"], figma_tokens_used)
                 except Exception as e:
-                    print(f"Gemini Compiler failed: {e}")
+                    log.warning(f"Gemini Compiler failed: {e}")
  
         # CHAT HISTORY SEED
         initial_history = []
@@ -1658,8 +2401,14 @@ async def create_project(
             })
  
         gorilla_auth_id = str(uuid.uuid4())
+
+        # Id + subdomain are computed here so the row is written in one round trip
+        pid = str(uuid.uuid4())
+        clean_name = _SLUG_UNSAFE_RE.sub("-", project_name.lower()).strip("-") or "app"
  
         res = supabase.table("projects").insert({
+            "id": pid,
+            "subdomain": f"{clean_name}-{pid}",
             "owner_id": user["id"],
             "name": project_name,
             "gorilla_auth_id": gorilla_auth_id,
@@ -1672,74 +2421,53 @@ async def create_project(
  
         if not res.data:
             raise Exception("DB Insert Failed - Check Service Role Key")
-        pid = res.data[0]["id"]
- 
-        clean_name = re.sub(r"[^a-z0-9-]", "-", project_name.lower()).strip("-") or "app"
-        supabase.table("projects").update({"subdomain": f"{clean_name}-{pid}"}).eq("id", pid).execute()
- 
-        bp_dir = globals().get("BOILERPLATE_DIR")
-        if not bp_dir or not os.path.isdir(bp_dir):
-            bp_dir = os.path.join(ROOT_DIR, "backend", "boilerplate")
+        _bump_project_count(user["id"])
+        # The editor redirect right after this is owner-checked: pre-seed it
+        _remember_project_owner(pid, user["id"])
  
-        if os.path.isdir(bp_dir):
-            files_to_insert = []
+        files_to_insert = []
+        if BOILERPLATE_EXISTS:
             # BUG 5 FIX: api_key is the captured var, real newlines in .env
-            files_to_insert.append({
-                "project_id": pid,
-                "path": ".env",
-                "content": (
-                    f"VITE_GORILLA_AUTH_ID={gorilla_auth_id}\\n"
-                    f"GORILLA_API_KEY={gorilla_api_key_for_env}"
-                    f"{supabase_env_content}"
-                ),
-            })
- 
-            for root, dirs, files in os.walk(bp_dir):
-                dirs[:] = [d for d in dirs if d not in ["node_modules", ".git", "dist", "build"]]
-                for file in files:
-                    if file.startswith("."):
-                        continue
-                    abs_path = os.path.join(root, file)
-                    rel_path = os.path.relpath(abs_path, bp_dir).replace("\\\\", "/")
-                    try:
-                        with open(abs_path, "r", encoding="utf-8") as f:
-                            files_to_insert.append({
-                                "project_id": pid, "path": rel_path, "content": f.read(),
-                            })
-                    except Exception:
-                        continue
- 
-            if files_to_insert and compiled_react_code:
-                for f in files_to_insert:
-                    if f["path"] in ["src/App.tsx", "src/App.jsx"]:
-                        f["content"] = compiled_react_code
-                        break
- 
-            if files_to_insert:
-                try:
-                    supabase.table("files").insert(files_to_insert).execute()
-                except Exception:
-                    for f in files_to_insert:
-                        try:
-                            supabase.table("files").upsert(f, on_conflict="project_id,path").execute()
-                        except Exception:
-                            pass
- 
+            env_content = (
+                f"VITE_GORILLA_AUTH_ID={gorilla_auth_id}\\n"
+                f"GORILLA_API_KEY={gorilla_api_key_for_env}"
+                f"{supabase_env_content}"
+            )
+            files_to_insert.append((".env", env_content, _json_row_tail(".env", env_content)))
+
+            # Boilerplate rows arrive pre-encoded; only the Figma-compiled
+            # App entry (if any) has to be encoded for this request
+            app_entry_pending = bool(compiled_react_code)
+            for rel_path, content, encoded in _load_boilerplate_json_rows():
+                if app_entry_pending and rel_path in ("src/App.tsx", "src/App.jsx"):
+                    app_entry_pending = False
+                    content, encoded = compiled_react_code, _json_row_tail(rel_path, compiled_react_code)
+                files_to_insert.append((rel_path, content, encoded))
+
+        # Prompt attachments ride in the same bulk insert instead of one
+        # request each
         if final_image:
-            try:
-                supabase.table("files").insert({
-                    "project_id": pid, "path": ".gorilla/prompt_image.b64", "content": final_image,
-                }).execute()
-            except Exception:
-                pass
- 
+            files_to_insert.append(
+                (".gorilla/prompt_image.b64", final_image, _json_row_tail(".gorilla/prompt_image.b64", final_image))
+            )
         if final_figma_json:
+            files_to_insert.append(
+                (".gorilla/figma.json", final_figma_json, _json_row_tail(".gorilla/figma.json", final_figma_json))
+            )
+
+        # Fixed-size chunks keep each PostgREST body small; a failing chunk
+        # falls back to one batch upsert (then per-row) for that chunk only
+        row_head = b'{"project_id":' + orjson.dumps(pid) + b","
+        for i in range(0, len(files_to_insert), BOILERPLATE_INSERT_CHUNK):
+            chunk = files_to_insert[i:i + BOILERPLATE_INSERT_CHUNK]
             try:
-                supabase.table("files").insert({
-                    "project_id": pid, "path": ".gorilla/figma.json", "content": final_figma_json,
-                }).execute()
+                db_insert_raw("files", b"[" + b",".join(row_head + encoded for _, _, encoded in chunk) + b"]")
             except Exception:
-                pass
+                db_upsert_batch(
+                    "files",
+                    [{"project_id": pid, "path": path, "content": content} for path, content, _ in chunk],
+                    on_conflict="project_id,path",
+                )
  
         return pid
  
@@ -1761,7 +2489,7 @@ async def create_project(
         return RedirectResponse(target_url, status_code=303)
  
     except Exception as e:
-        print(f"Create Error: {e}")
+        log.error(f"Create Error: {e}")
         return RedirectResponse("/dashboard?error=creation_failed", status_code=303)
 
 
@@ -1771,21 +2499,22 @@ async def project_editor(request: Request, project_id: str, file: str = "index.h
     user = get_current_user(request)
     _require_project_owner(user, project_id)
     
-    # 1. Fetch User Data (API Keys & Integrations)
-    user_data = db_select_one("users", {"id": user["id"]}, "gorilla_api_key, github_access_token, supabase_access_token")
+    # User keys, project row and token usage are independent: fetch them side by side
+    user_data, project, (used, limit) = await asyncio.gather(
+        db_select_one_async("users", {"id": user["id"]}, "gorilla_api_key, github_access_token, supabase_access_token"),
+        db_select_one_async("projects", {"id": project_id}),
+        asyncio.to_thread(get_token_usage_and_limit, user["id"]),
+    )
+
+    # 1. User Data (API Keys & Integrations)
     api_key = user_data.get("gorilla_api_key", "") if user_data else ""
     has_github = bool(user_data and user_data.get("github_access_token"))
     has_supabase = bool(user_data and user_data.get("supabase_access_token"))
     
-    # 2. Fetch Project Data
-    try:
-        res = supabase.table("projects").select("*").eq("id", project_id).single().execute()
-        project = res.data
-    except Exception:
-        project = {} 
+    # 2. Project Data
+    project = project or {}
     
     # 3. Token Check
-    used, limit = get_token_usage_and_limit(user["id"])
     user["tokens"] = {"used": used, "limit": limit}
     
     chat_history = project.get("chat_history", []) if project else []
@@ -1822,11 +2551,7 @@ async def project_preview(request: Request, project_id: str):
     _require_project_owner(user, project_id)
  
     # BUG 7 FIX: actually fetch the project
-    try:
-        res = supabase.table("projects").select("*").eq("id", project_id).single().execute()
-        project = res.data if res else None
-    except Exception:
-        project = None
+    project = await db_select_one_async("projects", {"id": project_id}, "name")
  
     project_name = project.get("name", "Untitled Project") if project else "Untitled Project"
  
@@ -1846,11 +2571,7 @@ async def project_settings(request: Request, project_id: str):
     user = get_current_user(request)
     _require_project_owner(user, project_id)
     
-    try:
-        res = supabase.table("projects").select("*").eq("id", project_id).single().execute()
-        project = res.data if res else None
-    except Exception:
-        project = None
+    project = await db_select_one_async("projects", {"id": project_id}, "name, description, snapshot_b64")
         
     return templates.TemplateResponse(
         "projects/project-settings.html",
@@ -1883,9 +2604,60 @@ async def project_settings_save(
             encoded_str = base64.b64encode(file_bytes).decode('utf-8')
             update_data["snapshot_b64"] = f"data:{mime_type};base64,{encoded_str}"
     
-    supabase.table("projects").update(update_data).eq("id", project_id).execute()
+    # PostgREST hands back the updated row, so the page renders from it
+    # directly instead of redirecting to a GET that re-reads the same row
+    res = await asyncio.to_thread(
+        lambda: supabase.table("projects").update(update_data).eq("id", project_id).execute()
+    )
+    project = res.data[0] if res and res.data else {"id": project_id, **update_data}
     
-    return RedirectResponse(f"/projects/{project_id}/settings", status_code=303)
+    return templates.TemplateResponse(
+        "projects/project-settings.html",
+        {"request": request, "project_id": project_id, "project": project, "project_name": project.get("name") or "Untitled Project", "user": user}
+    )
+
+
+class _ZipChunkSink(io.RawIOBase):
+    """Write-only, non-seekable sink: zipfile falls back to data descriptors
+    and we hand out whatever it wrote since the last drain."""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        self._chunks.append(bytes(b))
+        return len(b)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+EXPORT_ZIP_COMPRESSLEVEL = 1
+# Already-compressed formats: deflating them again only burns CPU
+EXPORT_ZIP_STORED_EXTS = (".png", ".jpg", ".jpeg", ".gif", ".webp", ".woff", ".woff2", ".gz", ".zip", ".mp3", ".mp4")
+
+def _stream_project_zip(files: List[Dict[str, Any]]):
+    """Yields the archive one entry at a time (sync generator -> runs in the threadpool)."""
+    sink = _ZipChunkSink()
+    with zipfile.ZipFile(sink, "w", zipfile.ZIP_DEFLATED, compresslevel=EXPORT_ZIP_COMPRESSLEVEL) as zf:
+        for file in files:
+            path = file.get("path", "unknown.txt").strip("/")
+            content = file.get("content") or ""
+            if path.lower().endswith(EXPORT_ZIP_STORED_EXTS):
+                zf.writestr(path, content, compress_type=zipfile.ZIP_STORED)
+            else:
+                zf.writestr(path, content)
+            chunk = sink.drain()
+            if chunk:
+                yield chunk
+    # Central directory is written on close
+    tail = sink.drain()
+    if tail:
+        yield tail
 
 
 # 7. EXPORT TO ZIP
@@ -1897,7 +2669,7 @@ async def project_export(request: Request, project_id: str):
     try:
         user_record = db_select_one("users", {"id": user["id"]}, "plan")
         current_plan = user_record.get("plan") if user_record else "free"
-    except:
+    except Exception:
         current_plan = "free"
 
     res = (
@@ -1911,27 +2683,18 @@ async def project_export(request: Request, project_id: str):
     if not files:
         raise HTTPException(status_code=404, detail="No files found in this project.")
 
-    zip_buffer = io.BytesIO()
-    try:
-        with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as zf:
-            for file in files:
-                path = file.get("path", "unknown.txt").strip("/")
-                content = file.get("content") or ""
-                zf.writestr(path, content)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to create ZIP: {e}")
-
-    zip_buffer.seek(0)
     filename = f"gorilla_project_{project_id[:8]}.zip"
     
     return StreamingResponse(
-        zip_buffer,
+        _stream_project_zip(files),
         media_type="application/zip",
         headers={
             "Content-Disposition": f"attachment; filename={filename}",
             "Cache-Control": "no-cache"
         }
     )
+
+
 # ==========================================================================
 # SANDBOX ROUTES AND HELPERS
 # ==========================================================================
@@ -1985,6 +2748,7 @@ def _init_sandbox_manager():
         fetch_files_fn=_fetch_file_tree,
         list_db_paths_fn=db_list_file_paths,
         progress_bus=progress_bus,
+        db_delete_paths_fn=db_delete_file_paths,
     )
  
 # At the very bottom of app.py (replacing the old set_log_callback calls):
@@ -2005,7 +2769,7 @@ async def start_sandbox(request: Request, project_id: str):
         return JSONResponse({"status": "running", "url": url or ""})
  
     try:
-        enforce_token_limit_or_raise(user["id"])
+        await asyncio.to_thread(enforce_token_limit_or_raise, user["id"])
     except HTTPException as e:
         if e.status_code == 402:
             return JSONResponse({"detail": "Token limit reached"}, status_code=402)
@@ -2017,7 +2781,7 @@ async def start_sandbox(request: Request, project_id: str):
         url = await _sandbox_manager.start_dev_server(project_id)
         return JSONResponse({"status": "ok", "url": url or ""})
     except Exception as e:
-        print(f"Sandbox boot error: {e}")
+        log.error(f"Sandbox boot error: {e}")
         return JSONResponse({"detail": str(e)}, status_code=500)
  
  
@@ -2115,7 +2879,7 @@ async def run_agent_loop(
                     if not org_id:
                         raise Exception("No Supabase organization")
                     db_pass = _secrets.token_urlsafe(16)
-                    safe_name = re.sub(r"[^a-zA-Z0-9 ]", "", project_name)[:32].strip() or "Gorilla App"
+                    safe_name = _DB_NAME_UNSAFE_RE.sub("", project_name)[:32].strip() or "Gorilla App"
                     proj_res = await client.post(
                         "https://api.supabase.com/v1/projects",
                         headers=headers,
@@ -2192,9 +2956,14 @@ async def run_agent_loop(
                 f"\\n--- CURRENT REQUEST ---\\n{prompt}"
             )
  
-        # Image attachment (first-turn only, read from Supabase files)
-        file_tree = await _fetch_file_tree(project_id)
-        image_b64 = file_tree.get(".gorilla/prompt_image.b64")
+        # Image attachment (first-turn only, read from Supabase files).
+        # Fetch just that row — the sandbox already holds the source tree.
+        image_row = await asyncio.to_thread(
+            db_select_one, "files",
+            {"project_id": project_id, "path": ".gorilla/prompt_image.b64"},
+            "content",
+        )
+        image_b64 = (image_row or {}).get("content")
  
         # ---- Callback to persist each assistant message as it arrives ----
         def on_assistant_message(msg: str):
@@ -2209,7 +2978,7 @@ async def run_agent_loop(
                     {"chat_history": db_history}
                 ).eq("id", project_id).execute()
             except Exception as e:
-                print(f"Persist assistant message failed: {e}")
+                log.warning(f"Persist assistant message failed: {e}")
 
 
         # ---- Hand off EVERYTHING to the sandbox manager ----
@@ -2246,10 +3015,8 @@ async def run_agent_loop(
         emit_progress(project_id, "Ready", 100)
  
     except Exception as e:
-        import traceback
         tb = traceback.format_exc()
-        print(f"⚠️ run_agent_loop EXCEPTION: {e}")
-        print(tb)
+        log.error(f"⚠️ run_agent_loop EXCEPTION: {e}\n{tb}")
         emit_status(project_id, "Fatal Error")
         # Actually surface the error message AND traceback to the chat UI
         # so you can see what broke without digging through terminal logs.
@@ -2272,7 +3039,7 @@ async def log_browser_event(
         form = await request.form()
         message = form.get("message", "")
         level = form.get("level", "INFO")
-        print(f"[{level}] Browser Event: {message[:100]}...")
+        log.info(f"[{level}] Browser Event: {message[:100]}...")
  
         msg_lc = message.lower()
         if not ("error" in msg_lc or "failed" in msg_lc or "syntax error" in msg_lc):
@@ -2280,12 +3047,12 @@ async def log_browser_event(
  
         # Backend mutex
         if project_id in active_ai_fixes:
-            print(f"[{project_id}] AI already fixing — ignoring duplicate")
+            log.info(f"[{project_id}] AI already fixing — ignoring duplicate")
             return JSONResponse({"status": "ignored"})
  
         # BUG 9 FIX: don't burn tokens if sandbox is gone — preview won't update anyway
         if not (_sandbox_manager and _sandbox_manager.is_running(project_id)):
-            print(f"[{project_id}] Sandbox not running — skipping auto-fix")
+            log.info(f"[{project_id}] Sandbox not running — skipping auto-fix")
             return JSONResponse({"status": "skipped_no_sandbox"})
  
         active_ai_fixes.add(project_id)
@@ -2293,11 +3060,9 @@ async def log_browser_event(
  
         owner_id = None
         try:
-            proj = db_select_one("projects", {"id": project_id}, "owner_id")
-            if proj:
-                owner_id = proj.get("owner_id")
+            owner_id = _project_owner_id(project_id)
         except Exception as db_err:
-            print(f"DB fetch error in /log: {db_err}")
+            log.warning(f"DB fetch error in /log: {db_err}")
  
         if not owner_id:
             active_ai_fixes.discard(project_id)
@@ -2321,10 +3086,8 @@ async def log_browser_event(
         )
  
     except Exception as e:
-        print(f"Logging error: {e}")
+        log.exception(f"Logging error: {e}")
         active_ai_fixes.discard(project_id)
-        import traceback
-        traceback.print_exc()
  
     return JSONResponse({"status": "ok"})
 # ==========================================================================
@@ -2349,15 +3112,11 @@ async def project_deploy_page(request: Request, project_id: str):
     user = get_current_user(request)
     _require_project_owner(user, project_id)
     
-    try:
-        res = supabase.table("projects").select("*").eq("id", project_id).single().execute()
-        project = res.data
-    except Exception:
-        project = {}
+    project = await db_select_one_async("projects", {"id": project_id}, "name, github_repo_url, vercel_optimized") or {}
         
-    user_data = db_select_one("users", {"id": user["id"]}, "github_access_token, gorilla_api_key")
+    user_data = await db_select_one_async("users", {"id": user["id"]}, "github_access_token, gorilla_api_key")
     has_github = bool(user_data and user_data.get("github_access_token"))
-    api_key = user_data.get("gorilla_api_key", "")
+    api_key = user_data.get("gorilla_api_key", "") if user_data else ""
 
     return templates.TemplateResponse(
         "projects/deploy.html",
@@ -2454,8 +3213,7 @@ async def optimize_for_vercel(request: Request, project_id: str):
         return {"status": "ok", "detail": "Optimized for Vercel"}
         
     except Exception as e:
-        import traceback
-        traceback.print_exc()
+        log.exception(f"❌ Vercel optimization failed for {project_id}")
         raise HTTPException(500, detail=str(e))
 
 # ==========================================================================
@@ -2478,114 +3236,114 @@ async def push_for_deployment(request: Request, project_id: str):
         
         # Sanitize to replace spaces and special characters with hyphens (required by GitHub)
         raw_name = project.get("name", "gorilla-project")
-        repo_name = re.sub(r'[^a-z0-9-]', '-', raw_name.lower()).strip('-')
+        repo_name = _SLUG_UNSAFE_RE.sub('-', raw_name.lower()).strip('-')
         
         if not repo_name:
             repo_name = f"gorilla-project-{project_id[:6]}"
             
-        files_res = supabase.table("files").select("path,content").eq("project_id", project_id).execute()
-        files = getattr(files_res, "data", [])
-        if not files and isinstance(files_res, list): files = files_res
+        def _fetch_files():
+            return supabase.table("files").select("path,content").eq("project_id", project_id).execute().data or []
 
         headers = {"Authorization": f"Bearer {token}", "Accept": "application/vnd.github.v3+json"}
         
-        async with httpx.AsyncClient() as client:
-            # A. Create or Find Repository
-            repo_res = await client.post(
-                "https://api.github.com/user/repos", 
-                json={"name": repo_name, "private": True, "auto_init": True}, 
-                headers=headers
-            )
-            if repo_res.status_code not in [201, 422]:
-                return JSONResponse({"detail": f"GitHub Repo Creation Failed: {repo_res.text}"}, status_code=500)
-            
-            repo_data = repo_res.json()
-            full_name = repo_data.get("full_name")
-            
-            # If repo already exists (422)
-            if repo_res.status_code == 422:
-                user_info_res = await client.get("https://api.github.com/user", headers=headers)
-                if user_info_res.status_code == 200:
-                    login = user_info_res.json().get("login")
-                    full_name = f"{login}/{repo_name}"
-                else:
-                    return JSONResponse({"detail": "Failed to fetch GitHub username for existing repo."}, status_code=500)
-                
-                # SAFETY NET: Check if the existing repo is completely empty!
-                branch_res = await client.get(f"https://api.github.com/repos/{full_name}/branches/main", headers=headers)
-                if branch_res.status_code == 404:
-                    import base64
-                    readme_content = base64.b64encode(b"# Init\n").decode("utf-8")
-                    await client.put(
-                        f"https://api.github.com/repos/{full_name}/contents/README.md",
-                        json={"message": "Initialize empty repository", "content": readme_content},
-                        headers=headers
-                    )
+        client = _github_http()
 
-            # B. Bulk Create Blobs & Tree
-            tree = []
-            for f in files:
-                path = f.get("path", "")
-                if path.startswith(".gorilla/"): continue
-                
-                # GitHub API rejects strictly empty strings for inline blobs. Give it a single space.
-                content = f.get("content")
-                if not content:
-                    content = " "
-                    
-                tree.append({
-                    "path": path.lstrip("/"),
-                    "mode": "100644",
-                    "type": "blob",
-                    "content": content
-                })
+        # A. Create or Find Repository. The file rows are fetched alongside it.
+        repo_res, files = await asyncio.gather(
+            client.post("/user/repos", json={"name": repo_name, "private": True, "auto_init": True}, headers=headers),
+            asyncio.to_thread(_fetch_files),
+        )
+        if repo_res.status_code not in [201, 422]:
+            return JSONResponse({"detail": f"GitHub Repo Creation Failed: {repo_res.text}"}, status_code=500)
+        
+        repo_data = repo_res.json()
+        full_name = repo_data.get("full_name")
+        
+        # If repo already exists (422)
+        if repo_res.status_code == 422:
+            user_info_res = await client.get("/user", headers=headers)
+            if user_info_res.status_code == 200:
+                login = user_info_res.json().get("login")
+                full_name = f"{login}/{repo_name}"
+            else:
+                return JSONResponse({"detail": "Failed to fetch GitHub username for existing repo."}, status_code=500)
             
-            if len(tree) == 0:
-                tree.append({
-                    "path": "README.md",
-                    "mode": "100644",
-                    "type": "blob",
-                    "content": f"# {project.get('name', 'Gorilla Project')}\n\nAuto-generated by Gor://a Builder."
-                })
-                
-            tree_res = await client.post(f"https://api.github.com/repos/{full_name}/git/trees", json={"tree": tree}, headers=headers)
+            # SAFETY NET: Check if the existing repo is completely empty!
+            branch_res = await client.get(f"/repos/{full_name}/branches/main", headers=headers)
+            if branch_res.status_code == 404:
+                import base64
+                readme_content = base64.b64encode(b"# Init\n").decode("utf-8")
+                await client.put(
+                    f"/repos/{full_name}/contents/README.md",
+                    json={"message": "Initialize empty repository", "content": readme_content},
+                    headers=headers
+                )
+
+        # B. Bulk Create Blobs & Tree
+        tree = []
+        for f in files:
+            path = f.get("path", "")
+            if path.startswith(".gorilla/"): continue
             
-            if tree_res.status_code != 201:
-                return JSONResponse({"detail": f"Git Tree Error: {tree_res.text}"}, status_code=500)
+            # GitHub API rejects strictly empty strings for inline blobs. Give it a single space.
+            content = f.get("content")
+            if not content:
+                content = " "
                 
-            tree_sha = tree_res.json()["sha"]
-            
-            # C. Create Commit
-            commit_res = await client.post(
-                f"https://api.github.com/repos/{full_name}/git/commits", 
-                json={"message": "Git Commit via Gor://a Builder", "tree": tree_sha}, 
-                headers=headers
-            )
-            if commit_res.status_code != 201:
-                return JSONResponse({"detail": f"Commit Error: {commit_res.text}"}, status_code=500)
-            
-            commit_sha = commit_res.json()["sha"]
-            
-            # D. Update Reference (Create or Update Main Branch)
-            ref_res = await client.post(f"https://api.github.com/repos/{full_name}/git/refs", json={"ref": "refs/heads/main", "sha": commit_sha}, headers=headers)
-            if ref_res.status_code == 422: # Reference already exists, force update it
-                await client.patch(f"https://api.github.com/repos/{full_name}/git/refs/heads/main", json={"sha": commit_sha, "force": True}, headers=headers)
-            
-            repo_url = f"https://github.com/{full_name}"
-            
-            # E. Save to DB
-            supabase.table("projects").update({"github_repo_url": repo_url}).eq("id", project_id).execute()
-            
-            return JSONResponse({
-                "status": "ok", 
-                "detail": "Code successfully pushed to GitHub.",
-                "repo_url": repo_url,
-                "full_name": full_name
+            tree.append({
+                "path": path.lstrip("/"),
+                "mode": "100644",
+                "type": "blob",
+                "content": content
+            })
+        
+        if len(tree) == 0:
+            tree.append({
+                "path": "README.md",
+                "mode": "100644",
+                "type": "blob",
+                "content": f"# {project.get('name', 'Gorilla Project')}\n\nAuto-generated by Gor://a Builder."
             })
             
+        tree_res = await client.post(f"/repos/{full_name}/git/trees", json={"tree": tree}, headers=headers)
+        
+        if tree_res.status_code != 201:
+            return JSONResponse({"detail": f"Git Tree Error: {tree_res.text}"}, status_code=500)
+            
+        tree_sha = tree_res.json()["sha"]
+        
+        # C. Create Commit
+        commit_res = await client.post(
+            f"/repos/{full_name}/git/commits", 
+            json={"message": "Git Commit via Gor://a Builder", "tree": tree_sha},
+            headers=headers
+        )
+        if commit_res.status_code != 201:
+            return JSONResponse({"detail": f"Commit Error: {commit_res.text}"}, status_code=500)
+        
+        commit_sha = commit_res.json()["sha"]
+        
+        # D. Update Reference (Create or Update Main Branch)
+        ref_res = await client.post(f"/repos/{full_name}/git/refs", json={"ref": "refs/heads/main", "sha": commit_sha}, headers=headers)
+        if ref_res.status_code == 422: # Reference already exists, force update it
+            await client.patch(f"/repos/{full_name}/git/refs/heads/main", json={"sha": commit_sha, "force": True}, headers=headers)
+        
+        repo_url = f"https://github.com/{full_name}"
+        
+        # E. Save to DB
+        await asyncio.to_thread(
+            lambda: supabase.table("projects").update({"github_repo_url": repo_url}).eq("id", project_id).execute()
+        )
+        
+        return JSONResponse({
+            "status": "ok", 
+            "detail": "Code successfully pushed to GitHub.",
+            "repo_url": repo_url,
+            "full_name": full_name
+        })
+        
     except Exception as e:
-        import traceback
-        traceback.print_exc()
+        log.exception(f"❌ Deploy push failed for {project_id}")
         return JSONResponse({"detail": str(e)}, status_code=500)
 
 # ==========================================================================
@@ -2636,13 +3394,7 @@ async def app_auth_google_callback(request: Request, code: str, state: str):
             "grant_type": "authorization_code",
         })
         tokens = res.json()
-        access_token = tokens.get("access_token")
-        
-        user_res = await client.get(
-            "https://www.googleapis.com/oauth2/v1/userinfo", 
-            headers={"Authorization": f"Bearer {access_token}"}
-        )
-        google_user = user_res.json()
+        google_user = await _google_user_from_tokens(client, tokens)
         
     user_payload = {
         "id": google_user.get("id"),
@@ -2703,122 +3455,120 @@ async def publish_to_github(request: Request, project_id: str):
     try:
         user = get_current_user(request)
         
-        proj_check = supabase.table("projects").select("owner_id").eq("id", project_id).single().execute()
-        if not proj_check.data or proj_check.data["owner_id"] != user["id"]:
+        if _project_owner_id(project_id) != user["id"]:
             return JSONResponse({"detail": "Unauthorized"}, status_code=403)
         
-        user_data = db_select_one("users", {"id": user["id"]}, "github_access_token")
+        user_data = await db_select_one_async("users", {"id": user["id"]}, "github_access_token")
         if not user_data or not user_data.get("github_access_token"):
             return JSONResponse({"detail": "GitHub account not connected."}, status_code=400)
         
         token = user_data["github_access_token"]
         
-        res = supabase.table("projects").select("*").eq("id", project_id).single().execute()
-        project = res.data
+        project = await db_select_one_async("projects", {"id": project_id}, "name") or {}
         
         # --- UPDATED LOGIC: Make repo name match the Gorilla project name ---
         raw_name = project.get("name", "gorilla-project")
         # Sanitize to replace spaces and special characters with hyphens (required by GitHub)
-        repo_name = re.sub(r'[^a-z0-9-]', '-', raw_name.lower()).strip('-')
+        repo_name = _SLUG_UNSAFE_RE.sub('-', raw_name.lower()).strip('-')
         
         # Fallback just in case the name was completely invalid characters
         if not repo_name:
             repo_name = f"gorilla-project-{project_id[:6]}"
         
-        files_res = supabase.table("files").select("path,content").eq("project_id", project_id).execute()
-        files = getattr(files_res, "data", [])
-        if not files and isinstance(files_res, list): files = files_res
+        def _fetch_files():
+            return supabase.table("files").select("path,content").eq("project_id", project_id).execute().data or []
 
         headers = {"Authorization": f"Bearer {token}", "Accept": "application/vnd.github.v3+json"}
         
-        async with httpx.AsyncClient() as client:
-            # A. Create or Find Repository
-            repo_res = await client.post(
-                "https://api.github.com/user/repos", 
-                json={"name": repo_name, "private": True, "auto_init": True}, 
-                headers=headers
-            )
-            if repo_res.status_code not in [201, 422]:
-                return JSONResponse({"detail": f"GitHub Repo Creation Failed: {repo_res.text}"}, status_code=500)
-            
-            repo_data = repo_res.json()
-            full_name = repo_data.get("full_name")
-            
-            # If repo already exists (422)
-            if repo_res.status_code == 422:
-                user_info_res = await client.get("https://api.github.com/user", headers=headers)
-                if user_info_res.status_code == 200:
-                    login = user_info_res.json().get("login")
-                    full_name = f"{login}/{repo_name}"
-                else:
-                    return JSONResponse({"detail": "Failed to fetch GitHub username for existing repo."}, status_code=500)
-                
-                # SAFETY NET: Check if the existing repo is completely empty!
-                branch_res = await client.get(f"https://api.github.com/repos/{full_name}/branches/main", headers=headers)
-                if branch_res.status_code == 404:
-                    # The repo exists but is empty! Initialize it manually via the Contents API
-                    readme_content = base64.b64encode(b"# Init\n").decode("utf-8")
-                    await client.put(
-                        f"https://api.github.com/repos/{full_name}/contents/README.md",
-                        json={"message": "Initialize empty repository", "content": readme_content},
-                        headers=headers
-                    )
+        client = _github_http()
 
-            # B. Bulk Create Blobs & Tree
-            tree = []
-            for f in files:
-                path = f.get("path", "")
-                if path.startswith(".gorilla/"): continue
-                
-                # GitHub API rejects strictly empty strings for inline blobs. Give it a single space.
-                content = f.get("content")
-                if not content:
-                    content = " "
-                    
-                tree.append({
-                    "path": path.lstrip("/"),
-                    "mode": "100644",
-                    "type": "blob",
-                    "content": content
-                })
+        # A. Create or Find Repository. The file rows are fetched alongside it.
+        repo_res, files = await asyncio.gather(
+            client.post("/user/repos", json={"name": repo_name, "private": True, "auto_init": True}, headers=headers),
+            asyncio.to_thread(_fetch_files),
+        )
+        if repo_res.status_code not in [201, 422]:
+            return JSONResponse({"detail": f"GitHub Repo Creation Failed: {repo_res.text}"}, status_code=500)
+        
+        repo_data = repo_res.json()
+        full_name = repo_data.get("full_name")
+        
+        # If repo already exists (422)
+        if repo_res.status_code == 422:
+            user_info_res = await client.get("/user", headers=headers)
+            if user_info_res.status_code == 200:
+                login = user_info_res.json().get("login")
+                full_name = f"{login}/{repo_name}"
+            else:
+                return JSONResponse({"detail": "Failed to fetch GitHub username for existing repo."}, status_code=500)
             
-            # If the tree is completely empty, inject a default README so the commit always succeeds.
-            if len(tree) == 0:
-                tree.append({
-                    "path": "README.md",
-                    "mode": "100644",
-                    "type": "blob",
-                    "content": f"# {project.get('name', 'Gorilla Project')}\n\nAuto-generated by Gor://a Builder."
-                })
-                
-            tree_res = await client.post(f"https://api.github.com/repos/{full_name}/git/trees", json={"tree": tree}, headers=headers)
+            # SAFETY NET: Check if the existing repo is completely empty!
+            branch_res = await client.get(f"/repos/{full_name}/branches/main", headers=headers)
+            if branch_res.status_code == 404:
+                # The repo exists but is empty! Initialize it manually via the Contents API
+                readme_content = base64.b64encode(b"# Init\n").decode("utf-8")
+                await client.put(
+                    f"/repos/{full_name}/contents/README.md",
+                    json={"message": "Initialize empty repository", "content": readme_content},
+                    headers=headers
+                )
+
+        # B. Bulk Create Blobs & Tree
+        tree = []
+        for f in files:
+            path = f.get("path", "")
+            if path.startswith(".gorilla/"): continue
             
-            if tree_res.status_code != 201:
-                return JSONResponse({"detail": f"Git Tree Error: {tree_res.text}"}, status_code=500)
+            # GitHub API rejects strictly empty strings for inline blobs. Give it a single space.
+            content = f.get("content")
+            if not content:
+                content = " "
                 
-            tree_sha = tree_res.json()["sha"]
-            
-            # C. Create Commit
-            commit_res = await client.post(f"https://api.github.com/repos/{full_name}/git/commits", json={"message": "Publish via Gor://a Builder", "tree": tree_sha}, headers=headers)
-            if commit_res.status_code != 201:
-                return JSONResponse({"detail": f"Commit Error: {commit_res.text}"}, status_code=500)
-            commit_sha = commit_res.json()["sha"]
-            
-            # D. Update Reference (Create or Update Main Branch)
-            ref_res = await client.post(f"https://api.github.com/repos/{full_name}/git/refs", json={"ref": "refs/heads/main", "sha": commit_sha}, headers=headers)
-            if ref_res.status_code == 422: # Reference already exists, force update it
-                await client.patch(f"https://api.github.com/repos/{full_name}/git/refs/heads/main", json={"sha": commit_sha, "force": True}, headers=headers)
-            
-            repo_url = f"https://github.com/{full_name}"
-            
-            # E. Save to DB
-            supabase.table("projects").update({"github_repo_url": repo_url}).eq("id", project_id).execute()
+            tree.append({
+                "path": path.lstrip("/"),
+                "mode": "100644",
+                "type": "blob",
+                "content": content
+            })
+        
+        # If the tree is completely empty, inject a default README so the commit always succeeds.
+        if len(tree) == 0:
+            tree.append({
+                "path": "README.md",
+                "mode": "100644",
+                "type": "blob",
+                "content": f"# {project.get('name', 'Gorilla Project')}\n\nAuto-generated by Gor://a Builder."
+            })
             
-            return JSONResponse({"status": "ok", "repo_url": repo_url})
+        tree_res = await client.post(f"/repos/{full_name}/git/trees", json={"tree": tree}, headers=headers)
+        
+        if tree_res.status_code != 201:
+            return JSONResponse({"detail": f"Git Tree Error: {tree_res.text}"}, status_code=500)
             
+        tree_sha = tree_res.json()["sha"]
+        
+        # C. Create Commit
+        commit_res = await client.post(f"/repos/{full_name}/git/commits", json={"message": "Publish via Gor://a Builder", "tree": tree_sha}, headers=headers)
+        if commit_res.status_code != 201:
+            return JSONResponse({"detail": f"Commit Error: {commit_res.text}"}, status_code=500)
+        commit_sha = commit_res.json()["sha"]
+        
+        # D. Update Reference (Create or Update Main Branch)
+        ref_res = await client.post(f"/repos/{full_name}/git/refs", json={"ref": "refs/heads/main", "sha": commit_sha}, headers=headers)
+        if ref_res.status_code == 422: # Reference already exists, force update it
+            await client.patch(f"/repos/{full_name}/git/refs/heads/main", json={"sha": commit_sha, "force": True}, headers=headers)
+        
+        repo_url = f"https://github.com/{full_name}"
+        
+        # E. Save to DB
+        await asyncio.to_thread(
+            lambda: supabase.table("projects").update({"github_repo_url": repo_url}).eq("id", project_id).execute()
+        )
+        
+        return JSONResponse({"status": "ok", "repo_url": repo_url})
+        
     except Exception as e:
-        import traceback
-        traceback.print_exc()
+        log.exception(f"❌ GitHub publish failed for {project_id}")
         return JSONResponse({"detail": str(e)}, status_code=500)
 
 # ==========================================================================
@@ -2829,20 +3579,54 @@ LOCKFILE_PATTERNS = [
     "package-lock.json", "yarn.lock", "pnpm-lock.yaml", "node_modules", ".git"
 ]
 
+# Source text compresses 3-5x; below this size gzip isn't worth the CPU.
+GZIP_MIN_BYTES = 1024
+# Above this, gzip runs in a worker thread instead of blocking the event loop
+GZIP_INLINE_MAX_BYTES = 64 * 1024
+
+async def _compressed_response(
+    request: Request, body: bytes, media_type: str, headers: Optional[Dict[str, str]] = None
+) -> Response:
+    """Gzips a response body when the client accepts it and it's big enough.
+    Done per-route (not GZipMiddleware) so SSE streams are never buffered."""
+    if len(body) >= GZIP_MIN_BYTES and "gzip" in request.headers.get("accept-encoding", ""):
+        if len(body) > GZIP_INLINE_MAX_BYTES:
+            compressed = await asyncio.to_thread(gzip.compress, body, compresslevel=5)
+        else:
+            compressed = gzip.compress(body, compresslevel=5)
+        return Response(
+            content=compressed,
+            media_type=media_type,
+            headers={**(headers or {}), "Content-Encoding": "gzip", "Vary": "Accept-Encoding"},
+        )
+    return Response(content=body, media_type=media_type, headers=headers)
+
 @app.get("/api/project/{project_id}/files")
-async def get_project_files(request: Request, project_id: str):
+async def get_project_files(
+    request: Request, project_id: str, include_content: bool = Query(True, alias="content")
+):
+    """
+    Project file listing. `?content=false` returns paths only — the file
+    tree needs nothing else and it skips downloading every file body.
+    """
     user = get_current_user(request)
     _require_project_owner(user, project_id)
 
-    res = (
-        supabase.table("files")
-        .select("path,content")
+    res = await asyncio.to_thread(
+        lambda: supabase.table("files")
+        .select("path,content" if include_content else "path")
         .eq("project_id", project_id)
         .execute()
     )
-    if asyncio.iscoroutine(res): res = await res
-    rows = getattr(res, "data", [])
-    if not rows and isinstance(res, list): rows = res
+    rows = res.data or []
+
+    if not include_content:
+        paths = [
+            r["path"] for r in rows
+            if r.get("path") and not any(x in r["path"] for x in LOCKFILE_PATTERNS)
+        ]
+        body = json.dumps({"files": [{"path": p} for p in paths]}).encode("utf-8")
+        return await _compressed_response(request, body, "application/json")
 
     clean_rows = []
     for r in rows:
@@ -2866,7 +3650,8 @@ async def get_project_files(request: Request, project_id: str):
         else:
             clean_rows.append({"path": path, "content": content})
 
-    return {"files": clean_rows}
+    body = json.dumps({"files": clean_rows}).encode("utf-8")
+    return await _compressed_response(request, body, "application/json")
 
 
 @app.get("/api/project/{project_id}/file")
@@ -2879,14 +3664,13 @@ async def get_file_content(request: Request, project_id: str, path: str):
         })
 
     try:
-        res = (
-            supabase.table("files")
+        res = await asyncio.to_thread(
+            lambda: supabase.table("files")
             .select("content")
             .eq("project_id", project_id)
             .eq("path", path)
             .execute()
         )
-        if asyncio.iscoroutine(res): res = await res
         content = ""
         if res.data and len(res.data) > 0:
             content = res.data[0].get("content", "")
@@ -2938,12 +3722,11 @@ async def _upload_asset_to_storage(
     mime_type = mime_type or "application/octet-stream"
     storage_path = f"{project_id}/{rel_path}"
 
-    supabase.storage.from_("project-assets").upload(
-        storage_path,
-        file_bytes,
-        {"content-type": mime_type, "upsert": True},
+    bucket = supabase.storage.from_("project-assets")
+    await asyncio.to_thread(
+        bucket.upload, storage_path, file_bytes, {"content-type": mime_type, "upsert": True}
     )
-    return supabase.storage.from_("project-assets").get_public_url(storage_path)
+    return bucket.get_public_url(storage_path)
 
 
 async def _write_binary_to_sandbox(
@@ -2966,7 +3749,7 @@ async def _write_binary_to_sandbox(
             f"mkdir -p '{dirp}' && printf '%s' '{b64}' | base64 -d > '{full_path}'"
         ])
     except Exception as e:
-        print(f"⚠️ Sandbox binary write failed for {rel_path}: {e}")
+        log.warning(f"⚠️ Sandbox binary write failed for {rel_path}: {e}")
 
 
 # ---------------------------------------------------------------------------
@@ -2997,7 +3780,8 @@ async def save_file(request: Request, project_id: str):
             raise HTTPException(status_code=500, detail=f"Storage upload failed: {e}")
 
         # 2. Persist the URL in the files table (not base64 — just a pointer)
-        db_upsert(
+        await asyncio.to_thread(
+            db_upsert,
             "files",
             {"project_id": project_id, "path": rel_path, "content": public_url},
             on_conflict="project_id,path",
@@ -3006,6 +3790,10 @@ async def save_file(request: Request, project_id: str):
         # 3. Write real binary to sandbox filesystem if a session is live
         await _write_binary_to_sandbox(project_id, rel_path, file_bytes)
 
+        await asyncio.to_thread(
+            lambda: supabase.table("projects").update({"updated_at": "now()"}).eq("id", project_id).execute()
+        )
+
     # ── Text file (JS, TSX, CSS, etc.) ───────────────────────────────────────
     else:
         if hasattr(content_obj, "filename"):
@@ -3022,21 +3810,16 @@ async def save_file(request: Request, project_id: str):
             # Plain string content from editor
             final_content = str(content_obj)
 
-        # 1. Persist text content in files table
-        db_upsert(
-            "files",
-            {"project_id": project_id, "path": rel_path, "content": final_content},
-            on_conflict="project_id,path",
-        )
+        # 1. Persist text content (and touch the project) in one round trip
+        await asyncio.to_thread(db_save_file, project_id, rel_path, final_content)
 
         # 2. Mirror to live sandbox
         if _sandbox_manager and _sandbox_manager.is_running(project_id):
             try:
                 await _sandbox_manager.write_file(project_id, rel_path, final_content)
             except Exception as e:
-                print(f"⚠️ Sandbox text write mirror failed: {e}")
+                log.warning(f"⚠️ Sandbox text write mirror failed: {e}")
 
-    supabase.table("projects").update({"updated_at": "now()"}).eq("id", project_id).execute()
     return {"success": True}
 
 @app.post("/api/project/{project_id}/delete")
@@ -3049,10 +3832,12 @@ async def delete_project(request: Request, project_id: str):
             try:
                 await _sandbox_manager.kill(project_id)
             except Exception as e:
-                print(f"Sandbox kill during delete failed: {e}")
+                log.warning(f"Sandbox kill during delete failed: {e}")
 
         # Pull all file paths so we can remove binary assets from Storage
-        files_res = supabase.table("files").select("path, content").eq("project_id", project_id).execute()
+        files_res = await asyncio.to_thread(
+            lambda: supabase.table("files").select("path, content").eq("project_id", project_id).execute()
+        )
         rows = getattr(files_res, "data", []) or []
 
         # Delete any Storage objects that belong to this project
@@ -3064,24 +3849,31 @@ async def delete_project(request: Request, project_id: str):
         ]
         if storage_paths:
             try:
-                supabase.storage.from_("project-assets").remove(storage_paths)
+                await asyncio.to_thread(supabase.storage.from_("project-assets").remove, storage_paths)
             except Exception as e:
-                print(f"Storage cleanup warning: {e}")
+                log.warning(f"Storage cleanup warning: {e}")
 
         # Delete DB rows
-        supabase.table("files").delete().eq("project_id", project_id).execute()
-        supabase.table("projects").delete().eq("id", project_id).execute()
+        await asyncio.to_thread(
+            lambda: supabase.table("files").delete().eq("project_id", project_id).execute()
+        )
+        _forget_cached_files(project_id)
+        await asyncio.to_thread(
+            lambda: supabase.table("projects").delete().eq("id", project_id).execute()
+        )
+        _forget_project_owner(project_id)
+        _PROJECT_COUNT_CACHE.pop(user["id"], None)
 
         return JSONResponse({"status": "success", "detail": "Project deleted."})
     except Exception as e:
-        print(f"Project deletion error: {e}")
+        log.error(f"Project deletion error: {e}")
         raise HTTPException(status_code=500, detail="Failed to delete project.")
 
 
 @app.get("/api/project/{project_id}/tokens")
 async def check_tokens(request: Request, project_id: str):
     user = get_current_user(request)
-    used, limit = get_token_usage_and_limit(user["id"])
+    used, limit = await asyncio.to_thread(get_token_usage_and_limit, user["id"])
     return {"used": used, "limit": limit}
 
 
@@ -3091,15 +3883,36 @@ async def check_tokens(request: Request, project_id: str):
 import mimetypes
 
 def _guess_media_type(path: str) -> str:
-    mt, _ = mimetypes.guess_type(path)
+    return _media_type_for_ext(os.path.splitext(path)[1].lower())
+
+@lru_cache(maxsize=64)
+def _media_type_for_ext(ext: str) -> str:
+    """Media type by extension; the set a project serves is tiny, so each
+    one hits the mimetypes table once per process."""
+    mt, _ = mimetypes.guess_type("f" + ext)
     if mt: return mt
-    if path.endswith(".js"): return "application/javascript"
-    if path.endswith(".css"): return "text/css"
-    if path.endswith(".html"): return "text/html"
-    if path.endswith(".json"): return "application/json"
+    if ext == ".js": return "application/javascript"
+    if ext == ".css": return "text/css"
+    if ext == ".html": return "text/html"
+    if ext == ".json": return "application/json"
     return "text/plain"
 
 
+# Preview assets change on every save, so browsers revalidate each time;
+# unchanged files come back as a bodiless 304.
+PREVIEW_ASSET_CACHE_CONTROL = "private, no-cache"
+
+def _content_etag(body: bytes) -> str:
+    # Weak: the same tag covers the gzip and identity encodings
+    return f'W/"{hashlib.md5(body, usedforsecurity=False).hexdigest()}"'
+
+async def _preview_asset_response(request: Request, body: bytes, media_type: str, etag: str) -> Response:
+    headers = {"ETag": etag, "Cache-Control": PREVIEW_ASSET_CACHE_CONTROL}
+    if_none_match = request.headers.get("if-none-match", "")
+    if if_none_match and etag in (t.strip() for t in if_none_match.split(",")):
+        return Response(status_code=304, headers=headers)
+    return await _compressed_response(request, body, media_type, headers)
+
 @app.get("/app/{project_id}/{path:path}")
 async def serve_project_file(request: Request, project_id: str, path: str):
     user = get_current_user(request)
@@ -3107,26 +3920,35 @@ async def serve_project_file(request: Request, project_id: str, path: str):
     
     if not path or path.endswith("/"): 
         path = (path or "") + "index.html"
-        
-    res = (
-        supabase.table("files")
+
+    key = (project_id, path)
+    cached = _FILE_CACHE.get(key)
+    if cached and cached[0] > time.time():
+        return await _preview_asset_response(request, *cached[1:])
+
+    epoch = _FILE_CACHE_EPOCH
+    res = await asyncio.to_thread(
+        lambda: supabase.table("files")
         .select("content")
         .eq("project_id", project_id)
         .eq("path", path)
         .maybe_single()
         .execute()
     )
-    if asyncio.iscoroutine(res): res = await res
-
     row = res.data if res else None
     
     if not row:
         raise HTTPException(status_code=404, detail=f"File not found: {path}")
         
-    return Response(
-        content=row.get("content", ""), 
-        media_type=_guess_media_type(path)
-    )
+    body = (row.get("content") or "").encode("utf-8")
+    media_type = _guess_media_type(path)
+    etag = _content_etag(body)
+    if len(body) <= FILE_CACHE_MAX_BODY_BYTES and epoch == _FILE_CACHE_EPOCH:
+        # Evict the oldest entry when full
+        if len(_FILE_CACHE) >= FILE_CACHE_MAX_ENTRIES:
+            _FILE_CACHE.pop(next(iter(_FILE_CACHE)), None)
+        _FILE_CACHE[key] = (time.time() + FILE_CACHE_TTL_SECONDS, body, media_type, etag)
+    return await _preview_asset_response(request, body, media_type, etag)
 
 
 # ==========================================================================
@@ -3134,6 +3956,34 @@ async def serve_project_file(request: Request, project_id: str, path: str):
 # ==========================================================================
 import json
 
+class _SubscriberQueue(asyncio.Queue):
+    """Bounded per-connection SSE queue. A snapshot event (see
+    _ProgressBus.COALESCE_TYPES) replaces a same-type event still waiting at
+    the tail instead of queueing behind it — only the latest value matters."""
+
+    def __init__(self, maxsize: int = 0):
+        super().__init__(maxsize=maxsize)
+        self._tail_kind: Optional[str] = None
+
+    def put_frame(self, frame: bytes, kind: Optional[str], coalesce: bool) -> None:
+        if coalesce and self._queue and self._tail_kind == kind:
+            self._queue[-1] = frame
+            return
+        try:
+            self.put_nowait(frame)
+        except asyncio.QueueFull:
+            # Bounded fan-out: a stalled tab loses its oldest event
+            # instead of growing its queue without limit.
+            self.get_nowait()
+            self.put_nowait(frame)
+        self._tail_kind = kind
+
+    def _get(self):
+        item = super()._get()
+        if not self._queue:
+            self._tail_kind = None
+        return item
+
 class _ProgressBus:
     """Progress bus with a short replay buffer so new SSE subscribers catch
     up on events that fired in the last few seconds. Fixes the race where
@@ -3141,15 +3991,20 @@ class _ProgressBus:
  
     REPLAY_WINDOW_S = 8.0       # replay events from last 8 seconds
     BUFFER_CAP      = 200       # per-project cap
+    QUEUE_MAX       = 256       # per-subscriber; slow tabs drop oldest events
+    # Latest-value-wins events. "status" is deliberately excluded: the editor
+    # reacts to specific status texts (Done/Ready/Offline), and "token_usage"
+    # carries per-turn deltas, so dropping one would lose usage.
+    COALESCE_TYPES  = frozenset({"progress"})
  
     def __init__(self):
-        self._queues: Dict[str, List[asyncio.Queue]] = {}
-        # project_id -> list of (timestamp, event_dict)
-        self._buffer: Dict[str, List[tuple]] = {}
+        self._queues: DefaultDict[str, Set[asyncio.Queue]] = defaultdict(set)
+        # project_id -> deque of (timestamp, sse_frame_bytes)
+        self._buffer: Dict[str, deque] = {}
  
     def subscribe(self, project_id: str) -> asyncio.Queue:
-        q = asyncio.Queue()
-        self._queues.setdefault(project_id, []).append(q)
+        q = _SubscriberQueue(maxsize=self.QUEUE_MAX)
+        self._queues[project_id].add(q)
  
         # Replay recent events so the new subscriber doesn\'t miss anything
         now = time.time()
@@ -3165,30 +4020,52 @@ class _ProgressBus:
         return q
  
     def unsubscribe(self, project_id: str, q: asyncio.Queue) -> None:
-        if project_id in self._queues and q in self._queues[project_id]:
-            self._queues[project_id].remove(q)
+        subs = self._queues.get(project_id)
+        if subs is None:
+            return
+        subs.discard(q)
+        if not subs:
+            del self._queues[project_id]
+ 
+    @staticmethod
+    def frame(event: Dict[str, Any]) -> bytes:
+        """Encodes an event as a ready-to-send SSE frame."""
+        return b"data: " + orjson.dumps(event) + b"\n\n"
  
     def emit(self, project_id: str, event: Dict[str, Any]) -> None:
-        # Push to all live subscribers
-        for q in self._queues.get(project_id, []):
-            try: q.put_nowait(event)
-            except Exception: pass
+        # Serialize once; every subscriber (and the replay buffer) shares
+        # the same pre-encoded frame.
+        try:
+            frame = self.frame(event)
+        except Exception:
+            return
  
-        # Also buffer for late subscribers
-        buf = self._buffer.setdefault(project_id, [])
-        buf.append((time.time(), event))
+        # Push to all live subscribers
+        kind = event.get("type")
+        coalesce = kind in self.COALESCE_TYPES
+        for q in self._queues.get(project_id, ()):
+            try:
+                q.put_frame(frame, kind, coalesce)
+            except Exception:
+                pass
  
-        # Trim the buffer by size
-        if len(buf) > self.BUFFER_CAP:
-            del buf[: len(buf) - self.BUFFER_CAP]
+        # Also buffer for late subscribers (deque trims by size itself)
+        now = time.time()
+        buf = self._buffer.get(project_id)
+        if buf is None:
+            buf = self._buffer[project_id] = deque(maxlen=self.BUFFER_CAP)
+        buf.append((now, frame))
  
         # Also trim by age (cheap, runs every emit)
-        cutoff = time.time() - self.REPLAY_WINDOW_S
+        cutoff = now - self.REPLAY_WINDOW_S
         while buf and buf[0][0] < cutoff:
-            buf.pop(0)
+            buf.popleft()
 
 progress_bus = _ProgressBus()
 
+_SSE_CONNECTED = _ProgressBus.frame({"type": "status", "text": "Connected"})
+_SSE_KEEPALIVE = b": keep-alive\n\n"
+
 def emit_log(pid: str, role: str, text: str) -> None:
     """Emits log to UI via SSE and archives non-UI roles to virtual FS."""
     progress_bus.emit(pid, {"type": "log", "role": role, "text": text})
@@ -3236,78 +4113,102 @@ def filtered_log_callback(project_id: str, role: str, text: str) -> None:
     try:
         emit_log(project_id, role_lc, text)
     except Exception as e:
-        print(f"filtered_log_callback failed: {e}")
+        log.warning(f"filtered_log_callback failed: {e}")
 
 
 # ==========================================================================
 # GATEKEEPER: LINTING
 # ==========================================================================
-import tempfile
-import subprocess
 import os
+import shutil
 
-def lint_code_with_esbuild(content: str, filename: str) -> str | None:
+@lru_cache(maxsize=1)
+def _esbuild_cmd() -> Tuple[str, ...]:
+    """
+    Resolves the esbuild executable once per process. Calling the binary
+    directly skips npx's package resolution + extra Node boot on every lint.
+    """
+    local_bin = os.path.join(ROOT_DIR, "node_modules", ".bin", "esbuild")
+    if os.path.isfile(local_bin):
+        return (local_bin,)
+    found = shutil.which("esbuild")
+    if found:
+        return (found,)
+    return ("npx", "--no-install", "esbuild")
+
+async def lint_code_with_esbuild(content: str, filename: str) -> str | None:
     if not filename.startswith("static/") or not filename.endswith(".js"):
         return None
 
     try:
-        with tempfile.NamedTemporaryFile(suffix=".js", delete=False, mode='w', encoding='utf-8') as tmp:
-            tmp.write(content)
-            tmp.write_path = tmp.name
-
-        result = subprocess.run(
-            ["npx", "esbuild", tmp.name, "--loader=jsx", "--format=esm", "--log-level=error"],
-            capture_output=True,
-            text=True,
-            timeout=10
+        # Async subprocess: a slow lint (or Node boot) never stalls the loop.
+        # Source goes in on stdin: no temp file to write, close and unlink.
+        proc = await asyncio.create_subprocess_exec(
+            *_esbuild_cmd(), "--loader=jsx", "--format=esm", "--log-level=error",
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE,
         )
-        
-        os.remove(tmp.name)
-
-        if result.returncode != 0:
-            return result.stderr.strip()
+        try:
+            _, stderr = await asyncio.wait_for(proc.communicate(content.encode("utf-8")), timeout=10)
+        except asyncio.TimeoutError:
+            proc.kill()
+            await proc.wait()
+            raise
+
+        if proc.returncode != 0:
+            return stderr.decode("utf-8", errors="replace").strip()
             
         return None
     except Exception as e:
-        print(f"⚠️ Linter failed to run: {e}")
+        log.warning(f"⚠️ Linter failed to run: {e}")
         return None
 
 
 # ==========================================================================
 # AI AGENT WORKFLOW (TRIGGER)
 # ==========================================================================
+# Substrings of paths the AI never needs to read (lockfiles, vendored trees)
+FILE_TREE_SKIP_PATTERNS = ("package-lock.json", "yarn.lock", "node_modules", ".git")
+
+# project_id -> in-flight tree load, so concurrent callers share one query
+_FILE_TREE_INFLIGHT: Dict[str, asyncio.Future] = {}
+
 async def _fetch_file_tree(project_id: str) -> Dict[str, str]:
     """
     Fetches the project files but strictly filters out massive lockfiles 
     to prevent AI context bloat and truncation errors.
+    Concurrent calls for the same project are coalesced into one query.
     """
+    fut = _FILE_TREE_INFLIGHT.get(project_id)
+    if fut is None:
+        fut = asyncio.ensure_future(_load_file_tree(project_id))
+        _FILE_TREE_INFLIGHT[project_id] = fut
+
+        def _done(f: asyncio.Future) -> None:
+            if _FILE_TREE_INFLIGHT.get(project_id) is f:
+                del _FILE_TREE_INFLIGHT[project_id]
+        fut.add_done_callback(_done)
+
+    # shield: one caller being cancelled mustn't cancel the shared load.
+    # Each caller gets its own dict so they can't mutate each other's tree.
+    return dict(await asyncio.shield(fut))
+
+async def _load_file_tree(project_id: str) -> Dict[str, str]:
     try:
+        # supabase-py is synchronous — run the query off the event loop so
+        # a large tree download doesn't stall every other request.
         query = supabase.table("files").select("path,content").eq("project_id", project_id)
-        res = query.execute()
-        
-        if asyncio.iscoroutine(res):
-            res = await res
-            
-        rows = getattr(res, "data", [])
-        if not rows and isinstance(res, list):
-            rows = res
-            
-        # 🛑 SHARK FILTER: Exclude files that cause 'Expected , or }' errors
-        filtered_tree = {}
-        for r in rows:
-            path = r.get("path", "")
-            if not path: continue
-            
-            # Skip giant cloggers that the AI doesn't need to read
-            if any(x in path for x in ["package-lock.json", "yarn.lock", "node_modules", ".git"]):
-                continue
-                
-            filtered_tree[path] = (r.get("content") or "")
-            
-        return filtered_tree
+        # 🛑 SHARK FILTER: Exclude files that cause 'Expected , or }' errors.
+        # Done in the query so the giant cloggers are never downloaded at all.
+        for pattern in FILE_TREE_SKIP_PATTERNS:
+            query = query.not_.like("path", f"*{pattern}*")
+        res = await asyncio.to_thread(query.execute)
+
+        return {r["path"]: r["content"] or "" for r in res.data or () if r["path"]}
         
     except Exception as e:
-        print(f"⚠️ Fetch Error: {e}")
+        log.error(f"⚠️ Fetch Error: {e}")
         return {}
 
 @app.post("/api/project/{project_id}/agent/start")
@@ -3316,7 +4217,7 @@ async def agent_start(request: Request, project_id: str):
     _require_project_owner(user, project_id)
  
     try:
-        enforce_token_limit_or_raise(user["id"])
+        await asyncio.to_thread(enforce_token_limit_or_raise, user["id"])
     except HTTPException as e:
         if e.status_code == 402:
             emit_log(project_id, "assistant", _render_token_limit_message())
@@ -3345,7 +4246,7 @@ async def agent_start(request: Request, project_id: str):
                 on_conflict="project_id,path",
             )
         except Exception as err:
-            print(f"Mid-chat image save failed: {err}")
+            log.warning(f"Mid-chat image save failed: {err}")
  
     if not skip_planner:
         emit_status(project_id, "Agent received prompt")
@@ -3372,9 +4273,7 @@ async def agent_start(request: Request, project_id: str):
             return
         exc = t.exception()
         if exc:
-            import traceback
-            print(f"⚠️ agent task crashed: {exc}")
-            traceback.print_exception(type(exc), exc, exc.__traceback__)
+            log.error(f"⚠️ agent task crashed: {exc}", exc_info=exc)
     task.add_done_callback(_log_task_exception)
  
     return {"started": True}
@@ -3388,13 +4287,23 @@ async def agent_events(request: Request, project_id: str):
     async def _gen():
         q = progress_bus.subscribe(project_id)
         try:
-            yield f"data: {json.dumps({'type':'status', 'text':'Connected'})}\n\n"
+            yield _SSE_CONNECTED
             while True:
                 try:
-                    ev = await asyncio.wait_for(q.get(), timeout=15)
-                    yield f"data: {json.dumps(ev)}\n\n"
+                    # Queue items are pre-encoded SSE frames (see _ProgressBus)
+                    frame = await asyncio.wait_for(q.get(), timeout=15)
                 except asyncio.TimeoutError:
-                    yield f": keep-alive\n\n"
+                    yield _SSE_KEEPALIVE
+                    continue
+                if q.empty():
+                    yield frame
+                    continue
+                # Burst (e.g. streaming logs): drain what's already queued
+                # and send it as one write instead of one per event
+                frames = [frame]
+                while not q.empty():
+                    frames.append(q.get_nowait())
+                yield b"".join(frames)
         finally:
             progress_bus.unsubscribe(project_id, q)
 
@@ -3463,7 +4372,7 @@ async def serve_negotiator(request: Request):
         db_user["tokens"] = {"remaining": max(0, limit - used)}
         
     except Exception as e:
-        print(f"Error fetching user for negotiation: {e}")
+        log.error(f"Error fetching user for negotiation: {e}")
         return RedirectResponse(url="/dashboard")
 
     # Now db_user absolutely contains 'gorilla_api_key' and 'tokens'
@@ -3494,14 +4403,14 @@ async def save_negotiation(request: Request, data: NegotiationResult):
             "first_month_price": str(final_price)
         }).eq("id", session_user["id"]).execute()
         
-        print(f"💰 User {session_user['id']} successfully negotiated first month to ${final_price}")
+        log.info(f"💰 User {session_user['id']} successfully negotiated first month to ${final_price}")
         
         return JSONResponse({
             "status": "success", 
             "checkout_url": f"/checkout/premium" # Redirects to Stripe logic
         })
     except Exception as e:
-        print(f"Error saving negotiated price: {e}")
+        log.error(f"Error saving negotiated price: {e}")
         raise HTTPException(status_code=500, detail="Database error while saving price.")
 
 # ==========================================================================
@@ -3537,17 +4446,16 @@ def _deduct_proxy_tokens(user_id: str, cost: float, feature: str):
     try:
         tokens_to_add = math.ceil(cost) # Round up fractional tokens
         
-        # 1. Fetch current tokens_used from the users table
-        res = supabase.table("users").select("tokens_used").eq("id", user_id).single().execute()
-        current_used = res.data.get("tokens_used", 0) if res.data and res.data.get("tokens_used") else 0
-        
-        # 2. Add the cost and update the database
-        new_total = current_used + tokens_to_add
-        supabase.table("users").update({"tokens_used": new_total}).eq("id", user_id).execute()
+        # Atomic increment, so concurrent proxy calls and counter flushes can't overwrite each other
+        new_total = _increment_tokens_used(user_id, tokens_to_add)
+        with _TOKEN_COUNTERS_LOCK:
+            c = _TOKEN_COUNTERS.get(user_id)
+            if c:
+                c["used"], c["refreshed_at"] = new_total, time.time()
         
-        print(f"💰 Deducted {tokens_to_add} tokens for {feature} (User: {user_id})")
+        log.info(f"💰 Deducted {tokens_to_add} tokens for {feature} (User: {user_id})")
     except Exception as e:
-        print(f"⚠️ Failed to deduct {cost} tokens for {user_id}: {e}")
+        log.warning(f"⚠️ Failed to deduct {cost} tokens for {user_id}: {e}")
 
 async def verify_gorilla_key(credentials: HTTPAuthorizationCredentials = Depends(security)):
     """
@@ -3617,7 +4525,7 @@ async def proxy_chat_completions(request: Request, auth=Depends(verify_gorilla_k
                                 if len(parts) > 1:
                                     token_val = parts[1].split(',')[0].split('}')[0].strip()
                                     total_tokens = int(token_val)
-                            except: pass
+                            except ValueError: pass
             
             # Bill the user after the stream closes (0.5 tokens per 1 API token)
             if total_tokens > 0:
@@ -3782,7 +4690,7 @@ async def proxy_chat_completions_bargain(request: Request, auth=Depends(verify_g
                                 if len(parts) > 1:
                                     token_val = parts[1].split(',')[0].split('}')[0].strip()
                                     total_tokens = int(token_val)
-                            except: pass
+                            except ValueError: pass
             
             # Bill the user after the stream closes (0.5 tokens per 1 API token)
             if total_tokens > 0:
@@ -43,9 +43,10 @@ from __future__ import annotations
 
 import os
 import re
+import json
 import time
 import hashlib
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 import httpx
 
@@ -102,22 +103,26 @@ def log_agent(role: str, message: str, project_id: str = "") -> None:
             pass
 
 
+# Static markup — built once at import, not per 402 response.
+TOKEN_LIMIT_HTML = (
+    '<div style="display:flex;flex-direction:column;align-items:center;'
+    'justify-content:center;padding:40px 30px;'
+    'background:linear-gradient(135deg,rgba(15,23,42,0.9),rgba(30,10,50,0.8));'
+    'border:1px solid rgba(217,70,239,0.3);border-radius:20px;'
+    'text-align:center;max-width:400px;margin:20px auto;'
+    'box-shadow:0 20px 60px rgba(0,0,0,0.5);">'
+    '<h2 style="color:#fff;font-size:24px;font-weight:700;margin:0 0 12px;">'
+    "Token Limit Reached</h2>"
+    '<p style="color:#94a3b8;font-size:14px;line-height:1.6;margin:0 0 28px;'
+    'max-width:280px;">Upgrade to Premium for unlimited access.</p>'
+    '<a href="/pricing" style="background:linear-gradient(135deg,#d946ef,#a855f7);'
+    'color:white;text-decoration:none;padding:14px 32px;border-radius:12px;'
+    'font-size:14px;font-weight:600;">Upgrade to Premium</a></div>'
+)
+
+
 def _render_token_limit_message() -> str:
-    return (
-        '<div style="display:flex;flex-direction:column;align-items:center;'
-        'justify-content:center;padding:40px 30px;'
-        'background:linear-gradient(135deg,rgba(15,23,42,0.9),rgba(30,10,50,0.8));'
-        'border:1px solid rgba(217,70,239,0.3);border-radius:20px;'
-        'text-align:center;max-width:400px;margin:20px auto;'
-        'box-shadow:0 20px 60px rgba(0,0,0,0.5);">'
-        '<h2 style="color:#fff;font-size:24px;font-weight:700;margin:0 0 12px;">'
-        "Token Limit Reached</h2>"
-        '<p style="color:#94a3b8;font-size:14px;line-height:1.6;margin:0 0 28px;'
-        'max-width:280px;">Upgrade to Premium for unlimited access.</p>'
-        '<a href="/pricing" style="background:linear-gradient(135deg,#d946ef,#a855f7);'
-        'color:white;text-decoration:none;padding:14px 32px;border-radius:12px;'
-        'font-size:14px;font-weight:600;">Upgrade to Premium</a></div>'
-    )
+    return TOKEN_LIMIT_HTML
 
 
 # ---------------------------------------------------------------------------
@@ -787,9 +792,54 @@ def _is_safe(cmd: str) -> bool:
 #  LLM call
 # ═══════════════════════════════════════════════════════════════════════════
 
+# One keep-alive client for every LLM call in the process, so agent turns
+# reuse the OpenRouter connection instead of a fresh TCP+TLS handshake each.
+_http_client: Optional[httpx.AsyncClient] = None
+
+
+def _get_http_client() -> httpx.AsyncClient:
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            timeout=180.0,
+            limits=httpx.Limits(max_connections=50, max_keepalive_connections=20),
+        )
+    return _http_client
+
+
+async def close_http_client() -> None:
+    """Closes the shared LLM client (call on app shutdown)."""
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+def _weigh_usage(model: str, usage: Dict[str, Any]) -> int:
+    p = usage.get("prompt_tokens", 0)
+    c = usage.get("completion_tokens", 0)
+    is_frontier = any(x in model for x in ["claude", "gpt-4", "gemini"])
+    is_mimo = "mimo" in model
+    if is_frontier:
+        weight = p * 0.6 + c * 2.4
+    elif is_mimo:
+        weight = p * 0.3 + c * 0.6   # mimo sits between deepseek and frontier
+    else:
+        weight = p * 0.2 + c * 0.3   # deepseek flash
+    return int(weight)
+
+
 async def _call_llm(
-    messages: list, model: str = MODEL, temperature: float = 0.6
+    messages: list,
+    model: str = MODEL,
+    temperature: float = 0.6,
+    on_delta: Optional[Callable[[str], None]] = None,
 ) -> Tuple[str, int]:
+    """
+    One chat completion. With `on_delta`, the response is streamed and each
+    content fragment is handed to the callback as it arrives; the return
+    value (full text, weighted tokens) is the same either way.
+    """
     messages = _compress_history(messages)
     payload = {
         "model": model,
@@ -807,23 +857,52 @@ async def _call_llm(
         "HTTP-Referer": SITE_URL,
         "X-Title": SITE_NAME,
     }
-    async with httpx.AsyncClient(timeout=180.0) as client:
+    client = _get_http_client()
+    if on_delta is None:
         resp = await client.post(OPENROUTER_URL, json=payload, headers=headers)
         resp.raise_for_status()
         data = resp.json()
-    content = data["choices"][0]["message"]["content"]
-    u = data.get("usage", {})
-    p = u.get("prompt_tokens", 0)
-    c = u.get("completion_tokens", 0)
-    is_frontier = any(x in model for x in ["claude", "gpt-4", "gemini"])
-    is_mimo = "mimo" in model
-    if is_frontier:
-        weight = p * 0.6 + c * 2.4
-    elif is_mimo:
-        weight = p * 0.3 + c * 0.6   # mimo sits between deepseek and frontier
-    else:
-        weight = p * 0.2 + c * 0.3   # deepseek flash
-    return content, int(weight)
+        content = data["choices"][0]["message"]["content"]
+        return content, _weigh_usage(model, data.get("usage", {}))
+
+    # Streaming: OpenAI-style SSE, usage arrives on the final chunk
+    payload["stream"] = True
+    payload["stream_options"] = {"include_usage": True}
+    parts: List[str] = []
+    usage: Dict[str, Any] = {}
+    async with client.stream("POST", OPENROUTER_URL, json=payload, headers=headers) as resp:
+        resp.raise_for_status()
+        async for line in resp.aiter_lines():
+            # Skip blanks and ": OPENROUTER PROCESSING" comments
+            if not line.startswith("data:"):
+                continue
+            data_str = line[5:].strip()
+            if data_str == "[DONE]":
+                break
+            try:
+                chunk = json.loads(data_str)
+            except ValueError:
+                continue
+            if chunk.get("error"):
+                # Mid-stream provider failure: surface it like the
+                # non-streaming path's raise_for_status would
+                err = chunk["error"]
+                msg = err.get("message") if isinstance(err, dict) else err
+                raise RuntimeError(f"OpenRouter stream error: {msg}")
+            if chunk.get("usage"):
+                usage = chunk["usage"]
+            for choice in chunk.get("choices") or []:
+                delta = (choice.get("delta") or {}).get("content")
+                if delta:
+                    parts.append(delta)
+                    try:
+                        on_delta(delta)
+                    except Exception:
+                        pass
+    content = "".join(parts)
+    if not content:
+        raise RuntimeError("OpenRouter stream ended without any content")
+    return content, _weigh_usage(model, usage)
 
 
 # ═══════════════════════════════════════════════════════════════════════════
@@ -1013,6 +1092,7 @@ class LineageAgent:
         image_b64: Optional[str] = None,
         previous_command_output: Optional[str] = None,
         agent_skills: Optional[Dict[str, Any]] = None,
+        on_delta: Optional[Callable[[str], None]] = None,
     ) -> Dict[str, Any]:
         import asyncio
 
@@ -1138,7 +1218,9 @@ class LineageAgent:
         log_agent("agent", f"v12 ({model.split('/')[-1]}, turn={len(self.messages) // 2})", self.project_id)
 
         try:
-            raw, tokens = await _call_llm(self.messages, model=model, temperature=0.6)
+            raw, tokens = await _call_llm(
+                self.messages, model=model, temperature=0.6, on_delta=on_delta
+            )
             self.total_tokens += tokens
         except Exception as e:
             log_agent("agent", f"LLM error: {e}", self.project_id)
@@ -1147,6 +1229,7 @@ class LineageAgent:
                 "commands": [],
                 "done": True,
                 "tokens": 0,
+                "error": True,
             }
 
         self.messages.append({"role": "assistant", "content": raw})
@@ -1195,9 +1278,11 @@ __all__ = [
     "set_log_callback",
     "log_agent",
     "_render_token_limit_message",
+    "TOKEN_LIMIT_HTML",
     "_append_history",
     "_get_history",
     "clear_history",
+    "close_http_client",
     "TokenSubstitution",
     "expand_prompt",
     "generate_plan",
@@ -16,6 +16,7 @@ import os
 import re
 import io
 import time
+import heapq
 import base64
 import tarfile
 import asyncio
@@ -50,6 +51,9 @@ FILE_CONTENT_SENTINEL = "═══GORILLA_CONTENT_START_9f8c═══"
 DEFAULT_PREVIEW_PORT = 8080
 DEFAULT_SERVER_PORT = 3000
 
+# Max tsc lint commands in flight per agent turn
+LINT_CONCURRENCY = 8
+
 # Speed fix: poll dev.log for this pattern instead of sleeping a fixed duration
 READY_SIGNAL_CMD = (
     "timeout 25 bash -c '"
@@ -145,6 +149,10 @@ class SandboxSession:
     total_billed_tokens: int = 0
     deps_installed: bool = False
     content_hashes: Dict[str, str] = field(default_factory=dict)
+    # path -> md5 of the last heredoc write, for every TS file this session
+    ts_write_hashes: Dict[str, str] = field(default_factory=dict, repr=False)
+    # path -> (md5 of all TS writes so far, tsc output) from the last lint
+    lint_cache: Dict[str, Tuple[str, str]] = field(default_factory=dict, repr=False)
     _billing_task: Optional[asyncio.Task] = field(default=None, repr=False)
     agent: Optional[Any] = field(default=None, repr=False)
     # Speed fix: cached file tree to avoid full FS dump every agent turn
@@ -166,6 +174,7 @@ class E2BSandboxManager:
         fetch_files_fn: Callable,
         list_db_paths_fn: Callable,
         progress_bus: Any = None,
+        db_delete_paths_fn: Optional[Callable] = None,
     ):
         self._sessions: Dict[str, SandboxSession] = {}
         self._db_upsert = db_upsert_fn
@@ -178,8 +187,14 @@ class E2BSandboxManager:
         self._emit_file_deleted = emit_file_deleted_fn
         self._fetch_files = fetch_files_fn
         self._list_db_paths = list_db_paths_fn
+        self._db_delete_paths = db_delete_paths_fn
         self._progress_bus = progress_bus
         self._idle_monitor_task: Optional[asyncio.Task] = None
+        # Idle-kill schedule: min-heap of (deadline, project_id). Checked
+        # lazily — a session touched since it was scheduled is re-pushed.
+        self._idle_heap: List[Tuple[float, str]] = []
+        self._idle_scheduled: Set[str] = set()
+        self._idle_wakeup: Optional[asyncio.Event] = None
         self._boot_locks: Dict[str, asyncio.Lock] = {}
         self._turn_locks: Dict[str, asyncio.Lock] = {}
         self._activity_counter: Dict[str, int] = {}
@@ -413,6 +428,7 @@ class E2BSandboxManager:
         self._sessions[project_id] = session
 
         session._billing_task = asyncio.create_task(self._billing_loop(project_id))
+        self._schedule_idle_check(project_id, session.last_activity + IDLE_TIMEOUT_S)
         if not self._idle_monitor_task or self._idle_monitor_task.done():
             self._idle_monitor_task = asyncio.create_task(self._idle_monitor())
 
@@ -625,6 +641,31 @@ class E2BSandboxManager:
             turn_count = turn + 1
             log_agent("agent", f"Turn {turn_count}/{MAX_TURNS_PER_REQUEST}", project_id)
 
+            # Stream the model's THOUGHT (the prose before its first ``` block)
+            # into a "Thinking" activity card, one line per chunk, while the
+            # completion is still arriving. Command text and heredoc file
+            # bodies after the first fence are never streamed to the UI.
+            think_id = self._next_activity_id(project_id)
+            self._emit_activity_start(project_id, think_id, "think", "", "Thinking")
+            pending_text: List[str] = []
+            thought_open = [True]
+
+            def on_delta(text: str, _aid: str = think_id) -> None:
+                if not thought_open[0]:
+                    return
+                pending_text.append(text)
+                if "\n" not in text:
+                    return
+                *lines, rest = "".join(pending_text).split("\n")
+                pending_text[:] = [rest] if rest else []
+                for line in lines:
+                    if line.lstrip().startswith("```"):
+                        thought_open[0] = False
+                        pending_text.clear()
+                        return
+                    if line.strip():
+                        self._emit_activity_chunk(project_id, _aid, "stdout", line[:400])
+
             result = await agent.run(
                 user_request=user_request,
                 file_tree=tree if turn == 0 else {},
@@ -636,7 +677,12 @@ class E2BSandboxManager:
                 image_b64=image_b64 if turn == 0 else None,
                 previous_command_output=previous_output,
                 agent_skills=agent_skills if turn == 0 else None,
+                on_delta=on_delta,
             )
+            tail = "".join(pending_text)
+            if tail.strip():
+                self._emit_activity_chunk(project_id, think_id, "stdout", tail[:400])
+            self._emit_activity_end(project_id, think_id, 1 if result.get("error") else 0)
             turn_tokens = result.get("tokens", 0) - total_tokens
             total_tokens = result.get("tokens", 0)
 
@@ -790,22 +836,51 @@ class E2BSandboxManager:
                         log_agent("agent", f"Health check failed: {e}", project_id)
                     break
 
-            # Linter-in-the-loop
+            # Linter-in-the-loop — every written TS file is linted
+            # concurrently (bounded), then reported in command order.
+            # A result is reused only while no TS file this session has changed,
+            # since tsc also type-checks everything the file imports.
+            lint_hashes: Dict[str, str] = {}
             for cmd in commands:
                 m = re.search(r"cat\s+>\s+['\"]?(\S+\.tsx?)['\"]?\s+<<", cmd)
                 if m:
-                    lint_path = m.group(1)
-                    try:
+                    # The heredoc command embeds the file body, so its hash
+                    # changes exactly when the written content does.
+                    lint_hashes[m.group(1)] = hashlib.md5(
+                        cmd.encode("utf-8", errors="replace")
+                    ).hexdigest()
+            lint_paths = list(lint_hashes)
+
+            if lint_paths:
+                session.ts_write_hashes.update(lint_hashes)
+                tree_hash = hashlib.md5(
+                    repr(sorted(session.ts_write_hashes.items())).encode("utf-8")
+                ).hexdigest()
+                lint_sem = asyncio.Semaphore(LINT_CONCURRENCY)
+
+                async def _lint(lint_path: str) -> str:
+                    cached = session.lint_cache.get(lint_path)
+                    if cached and cached[0] == tree_hash:
+                        return cached[1]
+                    async with lint_sem:
                         lint_result = await asyncio.to_thread(
                             session.sandbox.commands.run,
                             f"cd {APP_DIR} && npx tsc --noEmit {lint_path} 2>&1 | head -20",
                             timeout=15,
                         )
-                        lint_out = (lint_result.stdout or "").strip()
-                        if lint_out and ("error TS" in lint_out or "Error" in lint_out):
-                            raw_output += f"\n\nLINT ERRORS in {lint_path}:\n{lint_out[:800]}"
-                    except Exception:
-                        pass
+                    out = (lint_result.stdout or "").strip()
+                    session.lint_cache[lint_path] = (tree_hash, out)
+                    return out
+
+                lint_outs = await asyncio.gather(
+                    *(_lint(p) for p in lint_paths), return_exceptions=True
+                )
+                raw_output += "".join(
+                    f"\n\nLINT ERRORS in {lint_path}:\n{lint_out[:800]}"
+                    for lint_path, lint_out in zip(lint_paths, lint_outs)
+                    if not isinstance(lint_out, BaseException)
+                    and lint_out and ("error TS" in lint_out or "Error" in lint_out)
+                )
 
             # Poll browser console errors
             console_errs = await self._poll_console_errors(project_id)
@@ -1118,13 +1193,18 @@ class E2BSandboxManager:
         except Exception:
             pass
 
+        # DB writes go through the sync Supabase client — keep them off the loop
         if rows:
             try:
                 if self._db_upsert_batch:
-                    self._db_upsert_batch("files", rows, on_conflict="project_id,path")
+                    await asyncio.to_thread(
+                        self._db_upsert_batch, "files", rows, on_conflict="project_id,path"
+                    )
                 else:
                     for row in rows:
-                        self._db_upsert("files", row, on_conflict="project_id,path")
+                        await asyncio.to_thread(
+                            self._db_upsert, "files", row, on_conflict="project_id,path"
+                        )
                 for row in rows:
                     self._emit_file_changed(project_id, row["path"])
             except Exception as e:
@@ -1132,16 +1212,28 @@ class E2BSandboxManager:
 
         deleted_count = 0
         try:
-            db_paths = set(self._list_db_paths(project_id) or [])
-            to_delete = db_paths - current_sandbox_paths - {".env", ".gorilla_env"}
-            for p in to_delete:
+            db_paths = set(await asyncio.to_thread(self._list_db_paths, project_id) or [])
+            to_delete = sorted(db_paths - current_sandbox_paths - {".env", ".gorilla_env"})
+            deleted: List[str] = []
+            if to_delete and self._db_delete_paths:
                 try:
-                    self._db_delete("files", {"project_id": project_id, "path": p})
-                    self._emit_file_deleted(project_id, p)
-                    session.content_hashes.pop(p, None)
-                    deleted_count += 1
-                except Exception:
-                    pass
+                    await asyncio.to_thread(self._db_delete_paths, project_id, to_delete)
+                    deleted = to_delete
+                except Exception as e:
+                    print(f"⚠️ batch delete failed, falling back to per-path: {e}")
+            if not deleted:
+                for p in to_delete:
+                    try:
+                        await asyncio.to_thread(
+                            self._db_delete, "files", {"project_id": project_id, "path": p}
+                        )
+                        deleted.append(p)
+                    except Exception:
+                        pass
+            for p in deleted:
+                self._emit_file_deleted(project_id, p)
+                session.content_hashes.pop(p, None)
+                deleted_count += 1
         except Exception:
             pass
 
@@ -1261,23 +1353,54 @@ class E2BSandboxManager:
                     except Exception:
                         pass
 
+    def _schedule_idle_check(self, project_id: str, deadline: float) -> None:
+        if project_id in self._idle_scheduled:
+            return
+        self._idle_scheduled.add(project_id)
+        heapq.heappush(self._idle_heap, (deadline, project_id))
+        if self._idle_wakeup:
+            self._idle_wakeup.set()
+
     async def _idle_monitor(self) -> None:
+        # Sleeps until the earliest deadline instead of scanning every
+        # session on a fixed tick; kills land at the exact idle timeout.
+        if self._idle_wakeup is None:
+            self._idle_wakeup = asyncio.Event()
         while True:
             try:
-                now = time.time()
-                for pid in [
-                    p for p, s in list(self._sessions.items())
-                    if (now - s.last_activity) > IDLE_TIMEOUT_S
-                ]:
-                    print(f"💤 Idle kill: {pid}")
+                self._idle_wakeup.clear()
+                if not self._idle_heap:
+                    await self._idle_wakeup.wait()
+                    continue
+                deadline, pid = self._idle_heap[0]
+                delay = deadline - time.time()
+                if delay > 0:
                     try:
-                        await self._sync_once(pid)
-                    except Exception:
+                        await asyncio.wait_for(self._idle_wakeup.wait(), timeout=delay)
+                    except asyncio.TimeoutError:
                         pass
-                    await self.kill(pid)
+                    continue
+
+                heapq.heappop(self._idle_heap)
+                self._idle_scheduled.discard(pid)
+                s = self._sessions.get(pid)
+                if not s:
+                    continue
+                idle_deadline = s.last_activity + IDLE_TIMEOUT_S
+                if idle_deadline > time.time():
+                    # Touched since scheduled — push the new deadline
+                    self._schedule_idle_check(pid, idle_deadline)
+                    continue
+
+                print(f"💤 Idle kill: {pid}")
+                try:
+                    await self._sync_once(pid)
+                except Exception:
+                    pass
+                await self.kill(pid)
             except Exception as e:
                 print(f"Idle monitor error: {e}")
-            await asyncio.sleep(30)
+                await asyncio.sleep(1)
 
 
 sandbox_manager: Optional[E2BSandboxManager] = None
\ No newline at end of file
@@ -0,0 +1,23 @@
+-- ==========================================================
+-- TOKEN ACCOUNTING — atomic usage increment
+-- ==========================================================
+-- Called by the backend (service role) instead of SELECT + UPSERT, so
+-- concurrent sandboxes / proxy calls for the same user can't lose updates.
+
+create or replace function increment_tokens_used(
+    p_user_id uuid,
+    p_amount bigint,
+    p_default_limit bigint
+)
+returns bigint
+language sql
+as $$
+    insert into public.users (id, tokens_used, tokens_limit)
+    values (p_user_id, p_amount, p_default_limit)
+    on conflict (id) do update
+        set tokens_used = coalesce(public.users.tokens_used, 0) + excluded.tokens_used,
+            updated_at = now()
+    returning tokens_used;
+$$;
+
+revoke all on function increment_tokens_used(uuid, bigint, bigint) from public, anon, authenticated;
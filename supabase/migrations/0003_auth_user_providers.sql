@@ -0,0 +1,24 @@
+-- ==========================================================
+-- AUTH LOOKUP — single-user existence / provider check
+-- ==========================================================
+-- Used by signup and login instead of auth.admin.list_users(), which
+-- pages through every account just to match one email.
+-- Returns NULL when no account exists, otherwise the user's identity
+-- providers (e.g. {email}, {google}, {github,email}).
+
+create or replace function auth_user_providers(p_email text)
+returns text[]
+language sql
+stable
+security definer
+set search_path = ''
+as $$
+    select coalesce(array_agg(i.provider) filter (where i.provider is not null), '{}')
+    from auth.users u
+    left join auth.identities i on i.user_id = u.id
+    where u.email = lower(p_email)  -- GoTrue stores emails lowercased; keeps the email index usable
+    group by u.id
+    limit 1;
+$$;
+
+revoke all on function auth_user_providers(text) from public, anon, authenticated;
@@ -0,0 +1,27 @@
+-- ==========================================================
+-- PROJECT QUOTA — count + (over limit only) the project list
+-- ==========================================================
+-- One round trip for the free-tier check in /projects/create. The project
+-- rows are only aggregated when the owner is at/over the limit, since that
+-- is the only case where the dashboard is re-rendered with them.
+
+create or replace function check_project_quota(p_owner_id uuid, p_limit int)
+returns jsonb
+language sql
+stable
+as $$
+    with c as (
+        select count(*)::int as n from public.projects where owner_id = p_owner_id
+    )
+    select jsonb_build_object(
+        'count', c.n,
+        'projects', case when c.n >= p_limit then (
+            select coalesce(jsonb_agg(to_jsonb(p) order by p.created_at desc), '[]'::jsonb)
+            from public.projects p
+            where p.owner_id = p_owner_id
+        ) end
+    )
+    from c;
+$$;
+
+revoke all on function check_project_quota(uuid, int) from public, anon, authenticated;
@@ -0,0 +1,25 @@
+-- ==========================================================
+-- FILE SAVE — upsert + project touch in one statement
+-- ==========================================================
+-- The editor's save route used to upsert the file and then bump
+-- projects.updated_at in a second request. A data-modifying CTE does both
+-- in one round trip (and one transaction).
+
+create or replace function save_project_file(
+    p_project_id uuid,
+    p_path text,
+    p_content text
+)
+returns void
+language sql
+as $$
+    with saved as (
+        insert into public.files (project_id, path, content)
+        values (p_project_id, p_path, p_content)
+        on conflict (project_id, path) do update
+            set content = excluded.content
+    )
+    update public.projects set updated_at = now() where id = p_project_id;
+$$;
+
+revoke all on function save_project_file(uuid, text, text) from public, anon, authenticated;
@@ -0,0 +1,27 @@
+-- ==========================================================
+-- AUTH LOOKUP — make auth_user_providers an index probe
+-- ==========================================================
+-- GoTrue's only single-column email index on auth.users is the partial
+-- unique index users_email_partial_key (email) WHERE is_sso_user = false.
+-- A bare `email = ...` predicate doesn't imply that condition, so the planner
+-- couldn't use it and 0003's lookup scanned auth.users. Matching the index
+-- predicate turns it into one B-tree probe. This app has no SAML SSO users
+-- (Google/GitHub sign-ins are OAuth identities with is_sso_user = false).
+
+create or replace function auth_user_providers(p_email text)
+returns text[]
+language sql
+stable
+security definer
+set search_path = ''
+as $$
+    select coalesce(array_agg(i.provider) filter (where i.provider is not null), '{}')
+    from auth.users u
+    left join auth.identities i on i.user_id = u.id
+    where u.email = lower(p_email)  -- GoTrue stores emails lowercased
+      and u.is_sso_user = false     -- predicate of users_email_partial_key
+    group by u.id
+    limit 1;
+$$;
+
+revoke all on function auth_user_providers(text) from public, anon, authenticated;